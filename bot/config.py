@@ -1,7 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
 import os
-from typing import List
+import re
+from typing import Dict, List
 
 load_dotenv()
 
@@ -10,6 +11,67 @@ class Config:
     bot_token: str
     admins: List[int]
     auto_approve: bool
+    # Рассылка: общий лимит сообщений в секунду и число одновременных отправок
+    broadcast_rate: float = 25.0
+    broadcast_concurrency: int = 20
+    broadcast_retries: int = 3
+    # Как часто (в получателях) сохранять чекпоинт рассылки в базу
+    broadcast_checkpoint_every: int = 200
+    # Размер страницы при чтении подписчиков из базы
+    broadcast_page_size: int = 1000
+    # Write-behind: записи в базу копятся и коммитятся пачками
+    db_write_behind: bool = True
+    db_flush_size: int = 200
+    db_flush_interval: float = 0.05
+    # Воркеры планировщика отложенных сообщений
+    scheduler_workers: int = 4
+    # Конвейер заявок: воркеры быстрой (одобрение) и медленной (приветствие) полосы
+    join_approve_workers: int = 8
+    join_welcome_workers: int = 4
+    join_queue_size: int = 10000
+    welcome_rate: float = 20.0
+    # Лимит одобрений/отклонений в секунду при массовой обработке заявок из /pending.
+    # welcome_rate — на весь бот, при WORKERS > 1 делится между воркерами; approve_rate не делится:
+    # команды админов обрабатывает один воркер
+    approve_rate: float = 20.0
+    # FSM: размер LRU-кэша и время жизни записи в кэше (0 — без ограничения)
+    fsm_cache_size: int = 10000
+    fsm_cache_ttl: float = 0
+    # Режим получения апдейтов: polling (по умолчанию) или webhook
+    mode: str = "polling"
+    webhook_base_url: str = ""
+    webhook_path: str = "/webhook"
+    webhook_secret: str = ""
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    # Число процессов-воркеров (1 — всё в одном процессе), полос внутри воркера
+    # и период, с которым воркеры перечитывают настройки друг друга
+    workers: int = 1
+    worker_lanes: int = 64
+    settings_refresh: float = 5.0
+    # Порт HTTP-эндпоинта /metrics (0 — выключен); воркер N слушает порт + N
+    metrics_host: str = "0.0.0.0"
+    metrics_port: int = 0
+    # Уведомления админам о заявках: сколько заявок канала за окно приходят по
+    # отдельности с кнопками, остальные — одной сводкой в конце окна (секунды)
+    admin_notify_window: float = 10.0
+    admin_notify_threshold: int = 3
+    # Логи: общий уровень, уровни по модулям ("aiogram.event=WARNING,bot.services=DEBUG")
+    # и доля пропускаемых записей об апдейтах aiogram.event ниже WARNING (1 — все)
+    log_level: str = "INFO"
+    log_levels: Dict[str, str] = field(default_factory=dict)
+    log_event_sample: float = 0.01
+    # Архивация решённых заявок старше retention_days дней, по умолчанию выключена (0):
+    # при включении база один раз переводится в incremental auto_vacuum полным VACUUM.
+    # Раз в retention_interval секунд, пачками по retention_batch с паузой retention_pause
+    retention_days: int = 0
+    retention_interval: float = 6 * 3600
+    retention_batch: int = 500
+    retention_pause: float = 0.2
+    archive_dir: str = "archive"
+    vacuum_pages: int = 1000
+    # Как часто счётчики воронки сбрасываются в funnel_stats (секунды)
+    funnel_flush_interval: float = 30.0
 
 def load_config() -> Config:
     bot_token = os.getenv("BOT_TOKEN")
@@ -21,8 +83,63 @@ def load_config() -> Config:
 
     auto_approve = os.getenv("AUTO_APPROVE", "false").lower() == "true"
 
+    log_levels = {}
+    for item in os.getenv("LOG_LEVELS", "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            log_levels[name.strip()] = level.strip().upper()
+
+    if os.getenv("BOT_MODE", "polling").lower() == "webhook" and not os.getenv("WEBHOOK_SECRET"):
+        raise ValueError("WEBHOOK_SECRET обязателен в режиме webhook")
+    # Telegram принимает secret_token длиной 1-256 из A-Z, a-z, 0-9, _ и -
+    if os.getenv("WEBHOOK_SECRET") and not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", os.getenv("WEBHOOK_SECRET")):
+        raise ValueError("WEBHOOK_SECRET может содержать только A-Z, a-z, 0-9, _ и - (до 256 символов)")
+
     return Config(
         bot_token=bot_token,
         admins=admins,
-        auto_approve=auto_approve
+        auto_approve=auto_approve,
+        broadcast_rate=float(os.getenv("BROADCAST_RATE", "25")),
+        broadcast_concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "20")),
+        broadcast_retries=int(os.getenv("BROADCAST_RETRIES", "3")),
+        broadcast_checkpoint_every=int(os.getenv("BROADCAST_CHECKPOINT_EVERY", "200")),
+        broadcast_page_size=int(os.getenv("BROADCAST_PAGE_SIZE", "1000")),
+        db_write_behind=os.getenv("DB_WRITE_BEHIND", "true").lower() == "true",
+        db_flush_size=int(os.getenv("DB_FLUSH_SIZE", "200")),
+        db_flush_interval=int(os.getenv("DB_FLUSH_INTERVAL_MS", "50")) / 1000,
+        scheduler_workers=int(os.getenv("SCHEDULER_WORKERS", "4")),
+        join_approve_workers=int(os.getenv("JOIN_APPROVE_WORKERS", "8")),
+        join_welcome_workers=int(os.getenv("JOIN_WELCOME_WORKERS", "4")),
+        join_queue_size=int(os.getenv("JOIN_QUEUE_SIZE", "10000")),
+        welcome_rate=float(os.getenv("WELCOME_RATE", "20")),
+        approve_rate=float(os.getenv("APPROVE_RATE", "20")),
+        fsm_cache_size=int(os.getenv("FSM_CACHE_SIZE", "10000")),
+        fsm_cache_ttl=float(os.getenv("FSM_CACHE_TTL", "0")),
+        mode=os.getenv("BOT_MODE", "polling").lower(),
+        webhook_base_url=os.getenv("WEBHOOK_BASE_URL", "").rstrip("/"),
+        webhook_path=os.getenv("WEBHOOK_PATH", "/webhook"),
+        webhook_secret=os.getenv("WEBHOOK_SECRET", ""),
+        webhook_host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+        webhook_port=int(os.getenv("WEBHOOK_PORT", "8080")),
+        workers=int(os.getenv("WORKERS", "1")),
+        worker_lanes=int(os.getenv("WORKER_LANES", "64")),
+        settings_refresh=float(os.getenv("SETTINGS_REFRESH", "5")),
+        metrics_host=os.getenv("METRICS_HOST", "0.0.0.0"),
+        metrics_port=int(os.getenv("METRICS_PORT", "0")),
+        admin_notify_window=float(os.getenv("ADMIN_NOTIFY_WINDOW", "10")),
+        admin_notify_threshold=int(os.getenv("ADMIN_NOTIFY_THRESHOLD", "3")),
+        log_level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        log_levels=log_levels,
+        log_event_sample=float(os.getenv("LOG_EVENT_SAMPLE", "0.01")),
+        retention_days=int(os.getenv("RETENTION_DAYS", "0")),
+        retention_interval=float(os.getenv("RETENTION_INTERVAL", str(6 * 3600))),
+        retention_batch=int(os.getenv("RETENTION_BATCH", "500")),
+        retention_pause=float(os.getenv("RETENTION_PAUSE", "0.2")),
+        archive_dir=os.getenv("ARCHIVE_DIR", "archive"),
+        vacuum_pages=int(os.getenv("VACUUM_PAGES", "1000")),
+        funnel_flush_interval=float(os.getenv("FUNNEL_FLUSH_INTERVAL", "30")),
     )
+
+
+# Конфиг читается один раз при старте; модули импортируют этот объект
+config = load_config()
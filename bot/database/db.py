@@ -1,119 +1,725 @@
+import asyncio
+import logging
+import sqlite3
+from array import array
 import aiosqlite
 from pathlib import Path
 import os
-from typing import Optional, List, Tuple, Union
+from typing import Optional, List, Tuple, Union, AsyncIterator, Sequence, Any, Dict, Iterable
+
+from .intset import IntSet
+from .migrations import migrate
+
+logger = logging.getLogger(__name__)
 
 DB_PATH = Path("bot_database.sqlite3")
 
 if not DB_PATH.parent.exists():
     os.makedirs(DB_PATH.parent)
 
+# Одна операция записи: список (sql, параметры, executemany?) — выполняется целиком в одной транзакции
+Statement = Tuple[str, Sequence[Any], bool]
+
+
+def is_busy(error: Exception) -> bool:
+    # SQLITE_BUSY: блокировку записи держит другой процесс дольше busy_timeout
+    return isinstance(error, sqlite3.OperationalError) and (
+        "database is locked" in str(error) or "database is busy" in str(error)
+    )
+
+
 class Database:
     def __init__(self, db_path=DB_PATH):
         self.db_path = db_path
         self.db = None  # Сюда запишем соединение
+        # Отдельное соединение фоновой записи: транзакция пачки не смешивается с чтениями
+        self._write_db = None
+        self.write_behind = False
+        self.flush_size = 200
+        self.flush_interval = 0.05
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+        # Кэш настроек: key -> value (None — ключа нет в базе)
+        self._settings: Dict[str, Optional[str]] = {}
+        # Индекс в памяти: подписанные пользователи и открытые заявки (user_id, chat_id).
+        # None — индекс выключен (базу делят несколько процессов), каждый запрос идёт в базу
+        self.known_users: Optional[IntSet] = None
+        self.pending_pairs: Optional[set] = None
 
-    async def init_db(self):
-        self.db = await aiosqlite.connect(self.db_path)
-        await self.db.executescript("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                is_subscribed BOOLEAN DEFAULT 1,
-                first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS admins (
-                user_id INTEGER PRIMARY KEY
-            );
-
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT
-            );
-
-            CREATE TABLE IF NOT EXISTS join_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                username TEXT,
-                full_name TEXT,
-                chat_id INTEGER NOT NULL,
-                chat_title TEXT,
-                status TEXT DEFAULT 'pending',
-                approved_by INTEGER DEFAULT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        await self.db.execute("""
-            INSERT OR IGNORE INTO settings (key, value) VALUES ('auto_approve', 'true')
-        """)
-        await self.db.commit()
+    async def init_db(self, write_behind: bool = True, flush_size: int = 200, flush_interval: float = 0.05,
+                      settings_refresh: float = 0, known_index: bool = True, auto_vacuum: bool = False):
+        self.db = await self._connect()
+        # WAL: читатели не ждут писателя, а synchronous=NORMAL убирает fsync на каждый коммит
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        # Схема создаётся и обновляется версионными миграциями (PRAGMA user_version)
+        await migrate(self.db)
+        if auto_vacuum:
+            await self.enable_incremental_vacuum()
+        await self.reload_settings()
+        if known_index:
+            await self.load_known_index()
+
+        self.write_behind = write_behind
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        if write_behind:
+            # Транзакциями пачек управляем сами (BEGIN IMMEDIATE), поэтому автокоммит
+            self._write_db = await self._connect(isolation_level=None)
+            self._write_queue = asyncio.Queue()
+            self._writer = asyncio.create_task(self._writer_loop())
+        if settings_refresh:
+            self._refresher = asyncio.create_task(self._refresh_settings(settings_refresh))
+
+    async def _connect(self, **kwargs) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_path, **kwargs)
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    async def flush(self):
+        # Дожидаемся, пока всё из очереди записи попадёт на диск
+        if self._write_queue is not None:
+            await self._write_queue.join()
 
     async def close(self):
+        if self._refresher:
+            self._refresher.cancel()
+            self._refresher = None
+        if self._writer:
+            await self.flush()
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+            self._write_queue = None
+        if self._write_db:
+            await self._write_db.close()
+            self._write_db = None
         if self.db:
             await self.db.close()
 
+    # Запись
+    async def _write(self, sql: str, params: Sequence[Any] = (), many: bool = False, wait: bool = False):
+        return await self._write_group([(sql, params, many)], wait=wait)
+
+    async def _write_group(self, statements: List[Statement], wait: bool = False):
+        """Ставит запись в очередь write-behind.
+
+        С wait=True ждёт коммита пачки и возвращает lastrowid последнего запроса,
+        иначе возвращается сразу (ошибки пишутся в лог).
+        """
+        if not self.write_behind:
+            cursor = await self._apply(self.db, statements)
+            await self.db.commit()
+            return cursor.lastrowid
+
+        future = asyncio.get_running_loop().create_future() if wait else None
+        self._write_queue.put_nowait((statements, future))
+        if future is not None:
+            return await future
+
+    @staticmethod
+    async def _apply(conn: aiosqlite.Connection, statements: List[Statement]):
+        cursor = None
+        for sql, params, many in statements:
+            if many:
+                cursor = await conn.executemany(sql, params)
+            else:
+                cursor = await conn.execute(sql, params)
+        return cursor
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._write_queue.get()]
+            # Собираем пачку: до flush_size операций или пока не истечёт flush_interval
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.flush_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._write_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            attempt = 0
+            while True:
+                try:
+                    results = await self._apply_batch(batch)
+                    break
+                except Exception as e:
+                    # Пачка не записана целиком: откатываем транзакцию, чтобы следующая попытка
+                    # или пачка не продолжила её
+                    await self._rollback_batch()
+                    if is_busy(e):
+                        # Базу держит другой воркер: повторяем всю пачку, фоновые записи не теряем
+                        attempt += 1
+                        delay = min(0.05 * 2 ** attempt, 2.0)
+                        logger.warning(f"База занята, пачка из {len(batch)} записей: повтор #{attempt} через {delay}с")
+                        await asyncio.sleep(delay)
+                        continue
+                    # Диск полон, ошибка ввода-вывода, сбой коммита — отдаём ошибку всем
+                    logger.error(f"Не удалось записать пачку из {len(batch)} записей: {e}")
+                    results = [(future, None, e) for _, future in batch]
+                    break
+
+            for future, result, error in results:
+                if future is not None and not future.done():
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+            for _ in batch:
+                self._write_queue.task_done()
+
+    async def _rollback_batch(self):
+        if not self._write_db.in_transaction:
+            return
+        try:
+            await self._write_db.rollback()
+        except Exception as e:
+            logger.error(f"Не удалось откатить пачку: {e}")
+
+    async def _apply_batch(self, batch: List[Tuple[List[Statement], Optional[asyncio.Future]]]) -> List[Tuple]:
+        conn = self._write_db
+        results = []
+        # Вся пачка — одна транзакция; SAVEPOINT изолирует ошибку отдельной операции.
+        # IMMEDIATE берёт блокировку записи сразу: если базу держит другой процесс, ждём
+        # busy_timeout на BEGIN, а не получаем SQLITE_BUSY посреди пачки
+        await conn.execute("BEGIN IMMEDIATE")
+        for statements, future in batch:
+            try:
+                await conn.execute("SAVEPOINT write_op")
+                cursor = await self._apply(conn, statements)
+                await conn.execute("RELEASE write_op")
+                results.append((future, cursor.lastrowid, None))
+            except Exception as e:
+                if is_busy(e) or not conn.in_transaction:
+                    # Занятая база — повторяем пачку целиком; без транзакции (SQLITE_FULL, IOERR)
+                    # SQLite уже откатил всё, и точки сохранения нет
+                    raise
+                await conn.execute("ROLLBACK TO write_op")
+                await conn.execute("RELEASE write_op")
+                results.append((future, None, e))
+                if future is None:
+                    logger.error(f"Ошибка фоновой записи в базу: {e}")
+        await conn.commit()
+        return results
+
+    async def enable_incremental_vacuum(self):
+        # Режим auto_vacuum меняется только полным VACUUM — один раз, до запуска фоновой записи
+        async with self.db.execute("PRAGMA auto_vacuum") as cursor:
+            if (await cursor.fetchone())[0] == 2:
+                return
+        logger.info("Перевожу базу в auto_vacuum=INCREMENTAL (однократный VACUUM)")
+        await self.db.commit()
+        await self.db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await self.db.execute("VACUUM")
+
+    async def incremental_vacuum(self, pages: int) -> int:
+        # Возвращает файлу до pages свободных страниц; без auto_vacuum=INCREMENTAL ничего не делает
+        async with self.db.execute("PRAGMA freelist_count") as cursor:
+            free = (await cursor.fetchone())[0]
+        if not free:
+            return 0
+        # Прагма освобождает по странице на шаг, а execute делает только один шаг; executescript
+        # выполняет её до конца, но коммитит открытую транзакцию — поэтому отдельное соединение,
+        # чтобы не закрыть чужую транзакцию на середине
+        async with aiosqlite.connect(self.db_path) as conn:
+            await conn.execute("PRAGMA busy_timeout=5000")
+            await conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        async with self.db.execute("PRAGMA freelist_count") as cursor:
+            return free - (await cursor.fetchone())[0]
+
+    async def load_known_index(self, chunk_size: int = 50000):
+        # Отсортированный по первичному ключу поток сразу ложится в массив, без промежуточного set
+        user_ids = array("q")
+        async with self.db.execute(
+            "SELECT user_id FROM users WHERE is_subscribed = 1 ORDER BY user_id"
+        ) as cursor:
+            while rows := await cursor.fetchmany(chunk_size):
+                user_ids.extend(user_id for user_id, in rows)
+        known = IntSet.from_sorted(user_ids)
+        async with self.db.execute(
+            "SELECT user_id, chat_id FROM join_requests WHERE status = 'pending'"
+        ) as cursor:
+            self.pending_pairs = set(await cursor.fetchall())
+        self.known_users = known
+        logger.info(f"Индекс: {len(known)} подписчиков, {len(self.pending_pairs)} открытых заявок")
+
     # Настройки
+    async def reload_settings(self):
+        async with self.db.execute("SELECT key, value FROM settings") as cursor:
+            settings = {key: value for key, value in await cursor.fetchall()}
+        self._settings = settings
+
+    async def _refresh_settings(self, interval: float):
+        # Когда базу делят несколько процессов, подтягиваем чужие изменения настроек
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload_settings()
+            except Exception as e:
+                logger.error(f"Не удалось перечитать настройки: {e}")
+
     async def get_setting(self, key: str) -> Optional[str]:
-        async with self.db.execute("SELECT value FROM settings WHERE key = ?", (key,)) as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else None
+        if key in self._settings:
+            return self._settings[key]
+        return (await self.get_settings((key,)))[key]
+
+    async def get_settings(self, keys: Iterable[str]) -> Dict[str, Optional[str]]:
+        # Всё, чего нет в кэше, дочитываем одним запросом
+        keys = list(keys)
+        missing = [key for key in keys if key not in self._settings]
+        if missing:
+            placeholders = ", ".join("?" for _ in missing)
+            async with self.db.execute(
+                f"SELECT key, value FROM settings WHERE key IN ({placeholders})", missing
+            ) as cursor:
+                found = dict(await cursor.fetchall())
+            for key in missing:
+                self._settings[key] = found.get(key)
+        return {key: self._settings[key] for key in keys}
 
     async def set_setting(self, key: str, value: str):
-        await self.db.execute("""
+        await self._write("""
             INSERT INTO settings (key, value) VALUES (?, ?)
             ON CONFLICT(key) DO UPDATE SET value=excluded.value
-        """, (key, value))
-        await self.db.commit()
+        """, (key, value), wait=True)
+        # write-through: кэш обновляем только после успешного коммита
+        self._settings[key] = value
+
+    # Кэш file_id медиафайлов
+    async def get_media_file_ids(self) -> Dict[str, str]:
+        async with self.db.execute("SELECT content_hash, file_id FROM media_cache") as cursor:
+            return dict(await cursor.fetchall())
+
+    async def set_media_file_id(self, content_hash: str, path: str, file_id: str):
+        await self._write("""
+            INSERT INTO media_cache (content_hash, file_id, path) VALUES (?, ?, ?)
+            ON CONFLICT(content_hash) DO UPDATE SET
+                file_id=excluded.file_id, path=excluded.path, updated_at=CURRENT_TIMESTAMP
+        """, (content_hash, file_id, path))
+
+    async def delete_media_file_id(self, content_hash: str):
+        await self._write("DELETE FROM media_cache WHERE content_hash = ?", (content_hash,))
+
+    # Отложенные сообщения
+    async def add_scheduled(self, due_at: float, kind: str, chat_id: int, payload: str) -> int:
+        return await self._write("""
+            INSERT INTO scheduled_messages (due_at, kind, chat_id, payload) VALUES (?, ?, ?, ?)
+        """, (due_at, kind, chat_id, payload), wait=True)
+
+    async def add_scheduled_many(self, due_at: float, kind: str, chat_ids: List[int], payload: str):
+        await self._write("""
+            INSERT INTO scheduled_messages (due_at, kind, chat_id, payload) VALUES (?, ?, ?, ?)
+        """, [(due_at, kind, chat_id, payload) for chat_id in chat_ids], many=True, wait=True)
+
+    async def claim_due_scheduled(self, now: float, limit: int) -> List[Tuple]:
+        async with self.db.execute("""
+            SELECT id, kind, chat_id, payload, attempts FROM scheduled_messages
+            WHERE status = 'pending' AND due_at <= ?
+            ORDER BY due_at LIMIT ?
+        """, (now, limit)) as cursor:
+            rows = await cursor.fetchall()
+        if rows:
+            await self._write(
+                "UPDATE scheduled_messages SET status = 'sending' WHERE id = ?",
+                [(row[0],) for row in rows], many=True, wait=True
+            )
+        return rows
+
+    async def next_scheduled_due(self) -> Optional[float]:
+        async with self.db.execute(
+            "SELECT MIN(due_at) FROM scheduled_messages WHERE status = 'pending'"
+        ) as cursor:
+            row = await cursor.fetchone()
+            return row[0]
+
+    async def reset_claimed_scheduled(self):
+        await self._write("UPDATE scheduled_messages SET status = 'pending' WHERE status = 'sending'", wait=True)
+
+    async def delete_scheduled(self, job_id: int):
+        await self._write("DELETE FROM scheduled_messages WHERE id = ?", (job_id,))
+
+    async def retry_scheduled(self, job_id: int, due_at: float, attempts: int):
+        await self._write("""
+            UPDATE scheduled_messages SET status = 'pending', due_at = ?, attempts = ?
+            WHERE id = ?
+        """, (due_at, attempts, job_id), wait=True)
+
+    async def fail_scheduled(self, job_id: int):
+        await self._write("UPDATE scheduled_messages SET status = 'failed' WHERE id = ?", (job_id,))
+
+    # Состояния FSM
+    async def get_fsm_record(self, key: str) -> Optional[Tuple]:
+        async with self.db.execute("SELECT state, data FROM fsm_storage WHERE key = ?", (key,)) as cursor:
+            return await cursor.fetchone()
+
+    async def set_fsm_record(self, key: str, state: Optional[str], data: str):
+        await self._write("""
+            INSERT INTO fsm_storage (key, state, data) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                state=excluded.state, data=excluded.data, updated_at=CURRENT_TIMESTAMP
+        """, (key, state, data))
+
+    async def delete_fsm_record(self, key: str):
+        await self._write("DELETE FROM fsm_storage WHERE key = ?", (key,))
 
     # Пользователи
+    # Вернувшийся пользователь (снова вступил после блокировки) опять получает рассылки
+    ADD_USER_SQL = """
+        INSERT INTO users (user_id) VALUES (?)
+        ON CONFLICT (user_id) DO UPDATE SET is_subscribed = 1 WHERE is_subscribed = 0
+    """
+
+    def _new_users(self, user_ids: Iterable[int]) -> List[int]:
+        # Уже известных подписчиков не пишем: upsert для них ничего не изменил бы
+        if self.known_users is None:
+            return list(user_ids)
+        new = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in self.known_users]
+        for user_id in new:
+            self.known_users.add(user_id)
+        return new
+
+    def _forget_users(self, user_ids: Iterable[int]):
+        if self.known_users is not None:
+            for user_id in user_ids:
+                self.known_users.discard(user_id)
+
     async def add_user(self, user_id: int):
-        await self.db.execute("""
-            INSERT OR IGNORE INTO users (user_id) VALUES (?)
+        if self._new_users((user_id,)):
+            await self._write(self.ADD_USER_SQL, (user_id,))
+
+    async def add_users(self, user_ids: List[int]):
+        new = self._new_users(user_ids)
+        if new:
+            await self._write(self.ADD_USER_SQL, [(user_id,) for user_id in new], many=True)
+
+    async def add_members(self, members: List[Tuple[int, int]]):
+        # (user_id, chat_id) одобренных заявок: пользователь и его канал для сегментов рассылок
+        await self._write_group([
+            (self.ADD_USER_SQL, [(user_id,) for user_id in self._new_users(user_id for user_id, _ in members)], True),
+            ("""
+                INSERT OR IGNORE INTO user_chats (chat_id, user_id) VALUES (?, ?)
+            """, [(chat_id, user_id) for user_id, chat_id in members], True),
+        ])
+
+    async def mark_activated(self, user_id: int):
+        await self._write("""
+            UPDATE users SET activated_at = CURRENT_TIMESTAMP WHERE user_id = ? AND activated_at IS NULL
         """, (user_id,))
-        await self.db.commit()
+
+    async def mark_unsubscribed(self, user_ids: List[int]):
+        # Заблокировали бота или удалены: рассылки их пропускают
+        self._forget_users(user_ids)
+        await self._write("""
+            UPDATE users SET is_subscribed = 0 WHERE user_id = ? AND is_subscribed = 1
+        """, [(user_id,) for user_id in user_ids], many=True)
 
     # Заявки
+    # Повторная заявка того же пользователя в тот же канал не создаёт вторую ожидающую:
+    # уникальный частичный индекс по (user_id, chat_id) WHERE status = 'pending'
+    ADD_REQUEST_SQL = """
+        INSERT OR IGNORE INTO join_requests (user_id, username, full_name, chat_id, chat_title, status, approved_by)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """
+
+    async def _pending_request_id(self, user_id: int, chat_id: int) -> Optional[int]:
+        async with self.db.execute(
+            "SELECT id FROM join_requests WHERE user_id = ? AND chat_id = ? AND status = 'pending'",
+            (user_id, chat_id)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+    def _forget_pending(self, pairs: Iterable[Tuple[int, int]]):
+        if self.pending_pairs is not None:
+            self.pending_pairs.difference_update(pairs)
+
     async def add_request(self, user_id: int, username: Optional[str], full_name: Optional[str], chat_id: int, chat_title: str) -> int:
-        cursor = await self.db.execute("""
-            INSERT INTO join_requests (user_id, username, full_name, chat_id, chat_title)
-            VALUES (?, ?, ?, ?, ?)
-        """, (user_id, username, full_name, chat_id, chat_title))
-        await self.db.commit()
-        return cursor.lastrowid
+        # id заявки нужен сразу (для кнопок админам), поэтому ждём коммита пачки.
+        # Для повторной заявки возвращается id уже открытой
+        pair = (user_id, chat_id)
+        if self.pending_pairs is not None and pair in self.pending_pairs:
+            return await self._pending_request_id(user_id, chat_id)
+        request_id = await self._write(self.ADD_REQUEST_SQL, (
+            user_id, username, full_name, chat_id, chat_title, 'pending', None
+        ), wait=True)
+        if self.pending_pairs is None:
+            # Без индекса строка могла быть пропущена, а lastrowid тогда остаётся от чужой вставки
+            return await self._pending_request_id(user_id, chat_id)
+        self.pending_pairs.add(pair)
+        return request_id
+
+    async def record_request(self, user_id: int, username: Optional[str], full_name: Optional[str],
+                             chat_id: int, chat_title: str, status: str = 'pending',
+                             approved_by: Optional[int] = None):
+        # Как add_request, но без ожидания коммита — когда id заявки не нужен
+        pair = (user_id, chat_id)
+        if status == 'pending':
+            if self.pending_pairs is not None:
+                if pair in self.pending_pairs:
+                    return
+                self.pending_pairs.add(pair)
+        elif self.pending_pairs is None or pair in self.pending_pairs:
+            # Решённая заявка при открытой (поданной, пока автоодобрение было выключено) закрывает её,
+            # а не добавляет вторую строку; новая вставляется, только если закрывать нечего
+            self._forget_pending([pair])
+            await self._write_group([
+                ("""
+                    UPDATE join_requests SET status = ?, approved_by = ?
+                    WHERE user_id = ? AND chat_id = ? AND status = 'pending'
+                """, (status, approved_by, user_id, chat_id), False),
+                ("""
+                    INSERT INTO join_requests (user_id, username, full_name, chat_id, chat_title, status, approved_by)
+                    SELECT ?, ?, ?, ?, ?, ?, ? WHERE changes() = 0
+                """, (user_id, username, full_name, chat_id, chat_title, status, approved_by), False),
+            ])
+            return
+        await self._write(self.ADD_REQUEST_SQL, (
+            user_id, username, full_name, chat_id, chat_title, status, approved_by
+        ))
+
+    REQUEST_COLUMNS = (
+        "id", "user_id", "username", "full_name", "chat_id", "chat_title", "status", "approved_by", "created_at"
+    )
+
+    async def get_resolved_requests(self, older_than: str, after_id: int, limit: int) -> List[Tuple]:
+        # older_than — модификатор datetime(): '-90 days'. Обход по id, ожидающие заявки пропускаются
+        async with self.db.execute(f"""
+            SELECT {", ".join(self.REQUEST_COLUMNS)} FROM join_requests
+            WHERE id > ? AND status != 'pending' AND created_at < datetime('now', ?)
+            ORDER BY id LIMIT ?
+        """, (after_id, older_than, limit)) as cursor:
+            return await cursor.fetchall()
+
+    async def delete_requests(self, request_ids: List[int]):
+        await self._write(
+            "DELETE FROM join_requests WHERE id = ?", [(request_id,) for request_id in request_ids],
+            many=True, wait=True
+        )
 
     async def get_request_by_id(self, request_id: int) -> Optional[Tuple]:
         async with self.db.execute("SELECT * FROM join_requests WHERE id = ?", (request_id,)) as cursor:
             return await cursor.fetchone()
 
-    async def get_pending_requests(self) -> List[Tuple]:
-        async with self.db.execute("SELECT * FROM join_requests WHERE status = 'pending'") as cursor:
+    async def get_pending_page(self, after_id: int, limit: int, chat_id: Optional[int] = None) -> List[Tuple]:
+        # Keyset-пагинация по id: стоимость страницы не зависит от её номера
+        columns = "id, user_id, username, full_name, chat_id, chat_title, created_at"
+        if chat_id is None:
+            sql = f"""
+                SELECT {columns} FROM join_requests
+                WHERE status = 'pending' AND id > ?
+                ORDER BY id LIMIT ?
+            """
+            params = (after_id, limit)
+        else:
+            sql = f"""
+                SELECT {columns} FROM join_requests
+                WHERE status = 'pending' AND chat_id = ? AND id > ?
+                ORDER BY id LIMIT ?
+            """
+            params = (chat_id, after_id, limit)
+        async with self.db.execute(sql, params) as cursor:
             return await cursor.fetchall()
 
+    async def set_requests_status(self, updates: List[Tuple[int, str]], resolved_by: int):
+        # Все статусы пачки — одной транзакцией
+        if not updates:
+            return
+        await self._forget_pending_ids([request_id for request_id, _ in updates])
+        await self._write("""
+            UPDATE join_requests SET status = ?, approved_by = ?
+            WHERE id = ? AND status = 'pending'
+        """, [(status, resolved_by, request_id) for request_id, status in updates], many=True, wait=True)
+
+    async def _forget_pending_ids(self, request_ids: List[int]):
+        # Решённые заявки выходят из индекса открытых; пары берём из базы по первичному ключу
+        if self.pending_pairs is None or not self.pending_pairs:
+            return
+        placeholders = ", ".join("?" for _ in request_ids)
+        async with self.db.execute(
+            f"SELECT user_id, chat_id FROM join_requests WHERE id IN ({placeholders}) AND status = 'pending'",
+            request_ids
+        ) as cursor:
+            self._forget_pending(await cursor.fetchall())
+
     async def approve_request(self, request_id: int, approved_by: int):
-        await self.db.execute("""
+        await self._forget_pending_ids([request_id])
+        await self._write("""
             UPDATE join_requests SET status = 'approved', approved_by = ?
             WHERE id = ?
         """, (approved_by, request_id))
-        await self.db.commit()
 
     async def reject_request(self, request_id: int, rejected_by: int):
-        await self.db.execute("""
+        await self._forget_pending_ids([request_id])
+        await self._write("""
             UPDATE join_requests SET status = 'rejected', approved_by = ?
             WHERE id = ?
         """, (rejected_by, request_id))
-        await self.db.commit()
 
     async def auto_approve_request(self, user_id: int, chat_id: int):
-        await self.db.execute("""
+        self._forget_pending([(user_id, chat_id)])
+        await self._write("""
             UPDATE join_requests SET status = 'approved', approved_by = -1
             WHERE user_id = ? AND chat_id = ? AND status = 'pending'
         """, (user_id, chat_id))
-        await self.db.commit()
 
-    async def get_all_users(self) -> List[Tuple]:
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT user_id FROM users WHERE is_subscribed = 1") as cursor:
-                return await cursor.fetchall()
+    @staticmethod
+    def _audience(chat_id: Optional[int] = None, since: Optional[str] = None,
+                  until: Optional[str] = None, activated: Optional[bool] = None) -> Tuple[str, str, list]:
+        # FROM и WHERE для сегмента подписчиков; с каналом обходим user_chats по ключу (chat_id, user_id)
+        if chat_id is not None:
+            source = "user_chats m JOIN users u ON u.user_id = m.user_id"
+            conditions, params = ["m.chat_id = ?", "u.is_subscribed = 1"], [chat_id]
+        else:
+            source = "users u"
+            conditions, params = ["u.is_subscribed = 1"], []
+        if since:
+            conditions.append("u.first_seen >= ?")
+            params.append(since)
+        if until:
+            # until включительно: дата без времени покрывает весь день
+            conditions.append("u.first_seen < date(?, '+1 day')")
+            params.append(until)
+        if activated is not None:
+            conditions.append("u.activated_at IS NOT NULL" if activated else "u.activated_at IS NULL")
+        return source, " AND ".join(conditions), params
+
+    async def iter_users(self, after: int = 0, chunk_size: int = 1000, **segment) -> AsyncIterator[int]:
+        # Постранично по ключу (user_id > last) через общее соединение:
+        # память не зависит от числа подписчиков, первые id отдаются сразу.
+        # segment — фильтры _audience (chat_id, since, until, activated)
+        source, where, params = self._audience(**segment)
+        key = "m.user_id" if segment.get("chat_id") is not None else "u.user_id"
+        sql = f"SELECT {key} FROM {source} WHERE {where} AND {key} > ? ORDER BY {key} LIMIT ?"
+        last = after
+        while True:
+            async with self.db.execute(sql, (*params, last, chunk_size)) as cursor:
+                rows = await cursor.fetchall()
+            for (user_id,) in rows:
+                yield user_id
+            if len(rows) < chunk_size:
+                return
+            last = rows[-1][0]
+
+    async def count_users(self, **segment) -> int:
+        source, where, params = self._audience(**segment)
+        async with self.db.execute(f"SELECT COUNT(*) FROM {source} WHERE {where}", params) as cursor:
+            row = await cursor.fetchone()
+            return row[0]
+
+    # Выгрузка
+    EXPORT_COLUMNS = {
+        "users": ("user_id", "is_subscribed", "first_seen", "activated_at"),
+        "join_requests": REQUEST_COLUMNS,
+    }
+
+    async def export_rows(self, table: str, chunk_size: int = 5000) -> AsyncIterator[List[Tuple]]:
+        # Отдельное read-only соединение: в WAL оно читает снимок на момент начала запроса
+        # и не мешает записи, а рабочее соединение не стоит в очереди за долгим SELECT.
+        # Строки отдаются пачками по chunk_size — в памяти не больше одной пачки
+        columns = ", ".join(self.EXPORT_COLUMNS[table])
+        path = Path(self.db_path).resolve().as_uri()
+        async with aiosqlite.connect(f"{path}?mode=ro", uri=True) as conn:
+            async with conn.execute(f"SELECT {columns} FROM {table} ORDER BY rowid") as cursor:
+                while rows := await cursor.fetchmany(chunk_size):
+                    yield rows
+
+    # Воронка
+    async def add_funnel_counts(self, counts: List[Tuple[str, int, str, int]]):
+        # (час, канал, этап, прирост): счётчики складываются, поэтому процессы могут писать одновременно
+        await self._write("""
+            INSERT INTO funnel_stats (hour, chat_id, stage, count) VALUES (?, ?, ?, ?)
+            ON CONFLICT (hour, chat_id, stage) DO UPDATE SET count = count + excluded.count
+        """, counts, many=True, wait=True)
+
+    async def get_funnel(self, since: str, chat_id: Optional[int] = None) -> List[Tuple]:
+        # Диапазон по первичному ключу: строк не больше часов * каналов * этапов, события не пересчитываются
+        sql = "SELECT chat_id, stage, SUM(count) FROM funnel_stats WHERE hour >= ?"
+        params: list = [since]
+        if chat_id is not None:
+            sql += " AND chat_id = ?"
+            params.append(chat_id)
+        async with self.db.execute(sql + " GROUP BY chat_id, stage", params) as cursor:
+            return await cursor.fetchall()
+
+    # Рассылки
+    BROADCAST_JOB_COLUMNS = (
+        "id, created_by, payload, status, cursor, total, sent, failed, "
+        "status_chat_id, status_message_id, created_at"
+    )
+
+    async def create_broadcast_job(self, created_by: int, payload: str, total: int,
+                                   status_chat_id: int, status_message_id: int) -> int:
+        return await self._write("""
+            INSERT INTO broadcast_jobs (created_by, payload, total, status_chat_id, status_message_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (created_by, payload, total, status_chat_id, status_message_id), wait=True)
+
+    async def get_broadcast_job(self, job_id: int) -> Optional[Tuple]:
+        async with self.db.execute(
+            f"SELECT {self.BROADCAST_JOB_COLUMNS} FROM broadcast_jobs WHERE id = ?", (job_id,)
+        ) as cursor:
+            return await cursor.fetchone()
+
+    async def get_broadcast_jobs(self, statuses: Tuple[str, ...]) -> List[Tuple]:
+        placeholders = ", ".join("?" for _ in statuses)
+        async with self.db.execute(
+            f"SELECT {self.BROADCAST_JOB_COLUMNS} FROM broadcast_jobs "
+            f"WHERE status IN ({placeholders}) ORDER BY id",
+            statuses
+        ) as cursor:
+            return await cursor.fetchall()
+
+    async def set_broadcast_job_status(self, job_id: int, status: str):
+        await self._write("""
+            UPDATE broadcast_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (status, job_id), wait=True)
+
+    async def checkpoint_broadcast_job(self, job_id: int, cursor: int, sent: int, failed: int,
+                                       deliveries: List[Tuple[int, str]], unsubscribed: List[int] = ()):
+        # Пачка результатов, отписки и курсор пишутся одной транзакцией.
+        # Итог повторного прохода заменяет статус transient, оставшийся от основного
+        self._forget_users(unsubscribed)
+        await self._write_group([
+            ("""
+                INSERT INTO broadcast_deliveries (job_id, user_id, status) VALUES (?, ?, ?)
+                ON CONFLICT (job_id, user_id) DO UPDATE SET status = excluded.status
+            """, [(job_id, user_id, status) for user_id, status in deliveries], True),
+            ("""
+                UPDATE users SET is_subscribed = 0 WHERE user_id = ? AND is_subscribed = 1
+            """, [(user_id,) for user_id in unsubscribed], True),
+            ("""
+                UPDATE broadcast_jobs SET cursor = ?, sent = ?, failed = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (cursor, sent, failed, job_id), False),
+        ], wait=True)
+
+    async def get_broadcast_delivered_after(self, job_id: int, cursor: int) -> set:
+        async with self.db.execute("""
+            SELECT user_id FROM broadcast_deliveries WHERE job_id = ? AND user_id > ?
+        """, (job_id, cursor)) as cur:
+            return {row[0] for row in await cur.fetchall()}
+
+    async def iter_broadcast_transient(self, job_id: int, chunk_size: int = 1000) -> AsyncIterator[int]:
+        # Отложенные из-за временных ошибок получатели, постранично по ключу
+        last = 0
+        while True:
+            async with self.db.execute("""
+                SELECT user_id FROM broadcast_deliveries
+                WHERE job_id = ? AND status = 'transient' AND user_id > ?
+                ORDER BY user_id LIMIT ?
+            """, (job_id, last, chunk_size)) as cursor:
+                rows = await cursor.fetchall()
+            for (user_id,) in rows:
+                yield user_id
+            if len(rows) < chunk_size:
+                return
+            last = rows[-1][0]
 
 # Глобальный объект базы
 db = Database()
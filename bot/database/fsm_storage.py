@@ -0,0 +1,82 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from .db import Database
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище поверх общей базы бота.
+
+    Чтения идут через LRU-кэш, записи — через очередь write-behind базы,
+    поэтому недописанный мастер /broadcast переживает перезапуск. Несколько
+    процессов могут работать с одной базой (WAL); при шардировании апдейтов
+    по user_id ключ живёт в одном процессе и кэш остаётся точным. Без
+    шардирования задайте ttl, чтобы кэш перечитывал чужие изменения.
+    """
+
+    def __init__(self, database: Database, cache_size: int = 10000, ttl: float = 0):
+        self.database = database
+        self.cache_size = cache_size
+        self.ttl = ttl
+        # key -> (state, data, время загрузки)
+        self._cache: "OrderedDict[str, Tuple[Optional[str], Dict[str, Any], float]]" = OrderedDict()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) if part is not None else "" for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id,
+            key.business_connection_id, key.destiny
+        ))
+
+    async def _load(self, key: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        record = self._cache.get(key)
+        if record is not None and (not self.ttl or time.monotonic() - record[2] < self.ttl):
+            self._cache.move_to_end(key)
+            return record[0], record[1]
+
+        row = await self.database.get_fsm_record(key)
+        state, data = (row[0], json.loads(row[1]) if row[1] else {}) if row else (None, {})
+        self._remember(key, state, data)
+        return state, data
+
+    def _remember(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        self._cache[key] = (state, data, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _save(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        self._remember(key, state, data)
+        if state is None and not data:
+            await self.database.delete_fsm_record(key)
+        else:
+            await self.database.set_fsm_record(key, state, json.dumps(data, ensure_ascii=False))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self._key(key)
+        _, data = await self._load(storage_key)
+        await self._save(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise TypeError(f"Data must be a dict, got {type(data).__name__}")
+        storage_key = self._key(key)
+        state, _ = await self._load(storage_key)
+        await self._save(storage_key, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self._key(key))
+        return data.copy()
+
+    async def close(self) -> None:
+        # Соединением владеет Database, здесь достаточно дождаться записи
+        await self.database.flush()
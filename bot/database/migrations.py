@@ -0,0 +1,221 @@
+import logging
+import sqlite3
+from typing import Awaitable, Callable, List, Tuple, Union
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# Шаг миграции: SQL-скрипт или функция, получающая соединение
+Step = Union[str, Callable[[aiosqlite.Connection], Awaitable[None]]]
+
+
+async def add_column(conn: aiosqlite.Connection, table: str, column: str, ddl: str):
+    # ALTER TABLE ADD COLUMN без IF NOT EXISTS — проверяем сами, чтобы миграция была повторяемой
+    async with conn.execute(f"PRAGMA table_info({table})") as cursor:
+        columns = {row[1] for row in await cursor.fetchall()}
+    if column not in columns:
+        await conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+async def audience_segments(conn: aiosqlite.Connection):
+    await add_column(conn, "users", "activated_at", "TIMESTAMP DEFAULT NULL")
+    for statement in split_statements("""
+    -- Кто в каком канале: заполняется при одобрении заявки, ключ (chat_id, user_id)
+    -- отдаёт участников канала сразу в порядке user_id для постраничного обхода
+    CREATE TABLE IF NOT EXISTS user_chats (
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (chat_id, user_id)
+    ) WITHOUT ROWID;
+
+    INSERT OR IGNORE INTO user_chats (chat_id, user_id, joined_at)
+        SELECT chat_id, user_id, MIN(created_at) FROM join_requests
+        WHERE status = 'approved'
+        GROUP BY chat_id, user_id;
+
+    CREATE INDEX IF NOT EXISTS idx_users_first_seen
+        ON users (first_seen) WHERE is_subscribed = 1;
+    CREATE INDEX IF NOT EXISTS idx_users_activated
+        ON users (user_id) WHERE activated_at IS NOT NULL;
+    """):
+        await conn.execute(statement)
+
+
+# (версия, описание, шаг). Версии только добавляются, уже выпущенные не меняются.
+MIGRATIONS: List[Tuple[int, str, Step]] = [
+    (1, "Базовая схема", """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        is_subscribed BOOLEAN DEFAULT 1,
+        first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS admins (
+        user_id INTEGER PRIMARY KEY
+    );
+
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS join_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        full_name TEXT,
+        chat_id INTEGER NOT NULL,
+        chat_title TEXT,
+        status TEXT DEFAULT 'pending',
+        approved_by INTEGER DEFAULT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS broadcast_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_by INTEGER,
+        payload TEXT NOT NULL,
+        status TEXT DEFAULT 'running',
+        cursor INTEGER DEFAULT 0,
+        total INTEGER DEFAULT 0,
+        sent INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0,
+        status_chat_id INTEGER,
+        status_message_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+        job_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        PRIMARY KEY (job_id, user_id)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS media_cache (
+        content_hash TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        path TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS scheduled_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        due_at REAL NOT NULL,
+        kind TEXT NOT NULL,
+        chat_id INTEGER NOT NULL,
+        payload TEXT,
+        attempts INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'pending'
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_scheduled_messages_due
+        ON scheduled_messages (status, due_at);
+
+    INSERT OR IGNORE INTO settings (key, value) VALUES ('auto_approve', 'true');
+    """),
+    (2, "Индексы для горячих запросов по заявкам", """
+    -- auto_approve_request: WHERE user_id = ? AND chat_id = ? AND status = 'pending'
+    CREATE INDEX IF NOT EXISTS idx_join_requests_user_chat
+        ON join_requests (user_id, chat_id, status);
+
+    -- get_pending_page: частичные индексы содержат только ожидающие заявки
+    -- и не растут вместе с историей
+    CREATE INDEX IF NOT EXISTS idx_join_requests_pending
+        ON join_requests (id) WHERE status = 'pending';
+    CREATE INDEX IF NOT EXISTS idx_join_requests_pending_chat
+        ON join_requests (chat_id, id) WHERE status = 'pending';
+    """),
+    (3, "Хранилище FSM", """
+    CREATE TABLE IF NOT EXISTS fsm_storage (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID;
+    """),
+    (4, "Сегменты аудитории: участники каналов и активация", audience_segments),
+    (5, "Одна ожидающая заявка на пользователя и канал", """
+    -- Повторы, накопившиеся до индекса: оставляем самую раннюю заявку, остальные закрываем
+    UPDATE join_requests SET status = 'duplicate'
+    WHERE status = 'pending' AND id NOT IN (
+        SELECT MIN(id) FROM join_requests WHERE status = 'pending' GROUP BY user_id, chat_id
+    );
+
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_join_requests_pending_pair
+        ON join_requests (user_id, chat_id) WHERE status = 'pending';
+
+    -- auto_approve_request теперь обслуживает уникальный частичный индекс
+    DROP INDEX IF EXISTS idx_join_requests_user_chat;
+    """),
+    (6, "Счётчики воронки по часам", """
+    -- Одна строка на (час, канал, этап); канал 0 — событие без известного канала
+    CREATE TABLE IF NOT EXISTS funnel_stats (
+        hour TEXT NOT NULL,
+        chat_id INTEGER NOT NULL,
+        stage TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, chat_id, stage)
+    ) WITHOUT ROWID;
+    """),
+    (7, "Получатели рассылки, отложенные до повторного прохода", """
+    -- Повторный проход читает только отложенных: индекс не растёт с числом доставленных
+    CREATE INDEX IF NOT EXISTS idx_broadcast_deliveries_transient
+        ON broadcast_deliveries (job_id, user_id) WHERE status = 'transient';
+    """),
+]
+
+
+def split_statements(script: str) -> List[str]:
+    # executescript сам коммитит, поэтому режем скрипт на запросы и выполняем их в одной транзакции
+    statements, buffer = [], ""
+    for line in script.splitlines(keepends=True):
+        if line.strip().startswith("--"):
+            continue
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            if buffer.strip():
+                statements.append(buffer.strip())
+            buffer = ""
+    if buffer.strip():
+        statements.append(buffer.strip())
+    return statements
+
+
+async def get_version(conn: aiosqlite.Connection) -> int:
+    async with conn.execute("PRAGMA user_version") as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def migrate(conn: aiosqlite.Connection):
+    current = await get_version(conn)
+    # Обычный старт: одна проверка версии, без DDL
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        await conn.commit()
+        # IMMEDIATE сразу берёт блокировку записи: воркеры, стартующие одновременно,
+        # ждут друг друга (busy_timeout), а не падают с «database is locked»
+        await conn.execute("BEGIN IMMEDIATE")
+        if version <= await get_version(conn):
+            # Миграцию уже применил другой процесс, пока мы ждали блокировку
+            await conn.commit()
+            current = version
+            continue
+        logger.info(f"Применяю миграцию {version}: {description}")
+        try:
+            if isinstance(step, str):
+                for statement in split_statements(step):
+                    await conn.execute(statement)
+            else:
+                await step(conn)
+            await conn.execute(f"PRAGMA user_version = {version}")
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            logger.exception(f"Миграция {version} не применена")
+            raise
+        current = version
@@ -1,15 +1,20 @@
+import html
 import logging
+import os
+import time
 from aiogram import Router
 from aiogram.filters import Command, CommandObject
-from aiogram.types import Message
+from aiogram.types import FSInputFile, Message
 from aiogram.fsm.context import FSMContext
 
-from bot.config import load_config
+from bot.config import config
 from bot.database import db
+from bot.services.join_pipeline import join_pipeline
+from bot.services.export import EXPORT_FORMATS, EXPORT_TABLES, export_table
+from bot.services.funnel import funnel, hour_bucket, REQUEST, WELCOME, START, BROADCAST
 
 router = Router()
 logger = logging.getLogger(__name__)
-config = load_config()
 
 
 @router.message(Command("auto_approve"))
@@ -63,11 +68,112 @@ async def cmd_help(message: Message):
         "/auto_approve off|выкл — Отключить автоматическое одобрение заявок\n"
         "/auto_approve — Проверить текущее состояние\n"
         "/cancel — Отменить текущее действие\n"
-        "/broadcast — Отправить сообщение всем пользователям, которым бот уже писал"
+        "/broadcast — Отправить сообщение всем пользователям, которым бот уже писал\n"
+        "/bc_status [id] — Состояние рассылок\n"
+        "/bc_pause id — Поставить рассылку на паузу\n"
+        "/bc_resume id — Продолжить рассылку\n"
+        "/pipeline — Состояние очереди заявок\n"
+        "/pending [id канала] — Заявки в ожидании, массовое одобрение и отклонение\n"
+        "/export users|requests [csv|jsonl] — Выгрузить подписчиков или заявки файлом\n"
+        "/stats [часов] [id канала] — Воронка: заявки → приветствия → /start"
     )
     await message.answer(help_text)
 
 
-async def is_auto_approve_enabled() -> bool:
-    value = await db.get_setting("auto_approve")
-    return value == "true"
+@router.message(Command("pipeline"))
+async def cmd_pipeline(message: Message):
+    if message.from_user.id not in config.admins:
+        return
+
+    stats = join_pipeline.snapshot()
+    await message.answer(
+        "📥 Очередь заявок:\n\n"
+        f"Одобрение: {stats['approve_queue']} / {stats['queue_size']} "
+        f"(макс. ожидание {stats['approve_lag']:.1f}с)\n"
+        f"Приветствия: {stats['welcome_queue']} / {stats['queue_size']} "
+        f"(макс. ожидание {stats['welcome_lag']:.1f}с)\n\n"
+        f"Получено заявок: {stats['received']}\n"
+        f"Одобрено: {stats['approved']}, ошибок одобрения: {stats['approve_failed']}, "
+        f"flood-wait: {stats['approve_flood_waits']}\n"
+        f"Приветствий отправлено: {stats['welcomed']}, ошибок: {stats['welcome_failed']}\n"
+        f"Отложено в планировщик: {stats['welcome_deferred']}\n"
+        f"Ожиданий из-за переполнения: {stats['backpressure_waits']}"
+    )
+    # Максимальное ожидание считаем заново с момента последнего просмотра
+    join_pipeline.reset_lag()
+
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, command: CommandObject):
+    if message.from_user.id not in config.admins:
+        return
+
+    args = (command.args or "").lower().split()
+    name = args[0] if args else None
+    fmt = args[1] if len(args) > 1 else "csv"
+    if name not in EXPORT_TABLES or fmt not in EXPORT_FORMATS:
+        await message.answer("Использование: /export users|requests [csv|jsonl]")
+        return
+
+    status = await message.answer("⏳ Готовлю выгрузку...")
+    try:
+        path, count = await export_table(name, fmt)
+    except Exception as e:
+        logger.error(f"Не удалось выгрузить {name}: {e}")
+        await status.edit_text("❌ Не удалось подготовить выгрузку.")
+        return
+
+    try:
+        await message.answer_document(
+            FSInputFile(path, filename=os.path.basename(path)),
+            caption=f"📦 {name}: {count} строк"
+        )
+        await status.delete()
+    finally:
+        os.remove(path)
+    logger.info(f"Пользователь {message.from_user.id} выгрузил {name} ({fmt}, {count} строк)")
+
+
+def _percent(part: int, whole: int) -> str:
+    return f"{part * 100 / whole:.0f}%" if whole else "—"
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message, command: CommandObject):
+    if message.from_user.id not in config.admins:
+        return
+
+    hours, chat_id = 24, None
+    for arg in (command.args or "").split():
+        if arg.startswith("-") and arg[1:].isdigit():
+            chat_id = int(arg)
+        elif arg.isdigit():
+            hours = max(1, int(arg))
+        else:
+            await message.answer("Использование: /stats [часов] [id канала]")
+            return
+
+    # Досбрасываем накопленное в этом процессе, чтобы последние события тоже попали в отчёт
+    await funnel.flush()
+    since = hour_bucket(time.time() - (hours - 1) * 3600)
+    totals: dict = {}
+    for row_chat, stage, count in await db.get_funnel(since, chat_id):
+        totals.setdefault(row_chat, {})[stage] = count
+
+    if not totals:
+        await message.answer(f"За последние {hours} ч событий воронки нет.")
+        return
+
+    lines = [f"📊 Воронка за последние {hours} ч:"]
+    for row_chat, stages in sorted(totals.items()):
+        requests, welcomes, starts = (stages.get(stage, 0) for stage in (REQUEST, WELCOME, START))
+        title = html.escape(funnel.chat_titles.get(row_chat) or (str(row_chat) if row_chat else "без канала"))
+        lines.append(
+            f"\n{title}\n"
+            f"Заявки: {requests}\n"
+            f"Приветствия: {welcomes} ({_percent(welcomes, requests)})\n"
+            f"/start activate_protocol: {starts} ({_percent(starts, welcomes)})"
+        )
+        if stages.get(BROADCAST):
+            lines.append(f"Рассылок запущено: {stages[BROADCAST]}")
+    await message.answer("\n".join(lines))
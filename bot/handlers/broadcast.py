@@ -1,23 +1,31 @@
 from aiogram import Router, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import (
     Message, InputFile,
     ReplyKeyboardMarkup, KeyboardButton,
-    InlineKeyboardMarkup, InlineKeyboardButton,
     ContentType, MessageEntity
 )
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
-from bot.config import load_config
+from bot.config import config
 from bot.database import db
-import logging
-from typing import List
-
-logging.basicConfig(level=logging.DEBUG)
+from bot.services.broadcaster import Broadcaster, format_seconds
+from bot.services.broadcast_jobs import (
+    BroadcastJobManager, BroadcastJob, Segment, compile_payload, build_send_steps, RUNNING, PAUSED
+)
+from bot.services.funnel import funnel, BROADCAST
 
 router = Router()
-config = load_config()
+jobs = BroadcastJobManager(
+    Broadcaster(
+        rate=config.broadcast_rate,
+        concurrency=config.broadcast_concurrency,
+        retries=config.broadcast_retries
+    ),
+    checkpoint_every=config.broadcast_checkpoint_every,
+    page_size=config.broadcast_page_size
+)
 
 
 class BroadcastStates(StatesGroup):
@@ -45,8 +53,11 @@ async def cmd_broadcast_start(message: Message, state: FSMContext):
 
 @router.message(BroadcastStates.waiting_for_text, F.content_type == ContentType.TEXT)
 async def process_text_step(message: Message, state: FSMContext):
-    # Сохраняем chat_id и message_id исходного сообщения, чтобы потом его копировать
-    await state.update_data(source_chat_id=message.chat.id, source_message_id=message.message_id)
+    # Сохраняем сам текст и сущности (спойлеры, ссылки и т.п.): рассылка отправляет их без копирования
+    await state.update_data(
+        text=message.text,
+        entities=[entity.model_dump(mode="json", exclude_none=True) for entity in message.entities or []]
+    )
     await message.answer(
         "Шаг 2: Прикрепите фото или «кружок»(video_note), или отправьте /skip для пропуска."
     )
@@ -55,8 +66,8 @@ async def process_text_step(message: Message, state: FSMContext):
 
 @router.message(BroadcastStates.waiting_for_text, Command("skip"))
 async def skip_text_step(message: Message, state: FSMContext):
-    # Если текст пропущен — сохраним пустые данные, чтобы копировать только медиа или кнопку
-    await state.update_data(source_chat_id=None, source_message_id=None)
+    # Если текст пропущен — рассылаем только медиа или кнопку
+    await state.update_data(text=None, entities=None)
     await message.answer(
         "Шаг 2: Прикрепите фото или «кружок»(video_note), или отправьте /skip для пропуска."
     )
@@ -68,8 +79,12 @@ async def skip_text_step(message: Message, state: FSMContext):
     F.content_type.in_({ContentType.PHOTO, ContentType.VIDEO_NOTE})
 )
 async def process_media_step(message: Message, state: FSMContext):
-    # Аналогично сохраняем id сообщения с медиа для копирования
-    await state.update_data(media_source_chat_id=message.chat.id, media_source_message_id=message.message_id)
+    # file_id уже загруженного медиа: получателям оно уходит без повторной загрузки
+    if message.photo:
+        media = {"type": "photo", "file_id": message.photo[-1].file_id}
+    else:
+        media = {"type": "video_note", "file_id": message.video_note.file_id}
+    await state.update_data(media=media)
     await message.answer(
         "Шаг 3: Отправьте кнопку в формате: текст кнопки / URL ссылки (можно / без пробелов)\n\n"
         "Поддерживаются ссылки типа: www.domain.com, t.me/ссылка_или_изернаейм\n\n"
@@ -80,7 +95,7 @@ async def process_media_step(message: Message, state: FSMContext):
 
 @router.message(BroadcastStates.waiting_for_media, Command("skip"))
 async def skip_media_step(message: Message, state: FSMContext):
-    await state.update_data(media_source_chat_id=None, media_source_message_id=None)
+    await state.update_data(media=None)
     await message.answer(
         "Шаг 3: Отправьте кнопку в формате: текст кнопки / URL ссылки (можно / без пробелов)\n\n"
         "Поддерживаются ссылки типа: www.domain.com, t.me/ссылка_или_изернаейм\n\n"
@@ -111,126 +126,65 @@ async def process_button_step(message: Message, state: FSMContext):
             await message.answer("❗ Ссылка должна начинаться с http://, https://, www. или t.me/")
             return
 
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=btn_text, url=btn_url)]
-    ])
-
-    await state.update_data(button=keyboard)
+    # Храним кнопку как dict: FSM-данные и задание рассылки должны сериализоваться в JSON
+    await state.update_data(button={"text": btn_text, "url": btn_url})
     await send_preview(message, state)
 
 
 async def send_preview(message: Message, state: FSMContext):
     data = await state.get_data()
 
-    source_chat_id = data.get("source_chat_id")
-    source_message_id = data.get("source_message_id")
-    media_source_chat_id = data.get("media_source_chat_id")
-    media_source_message_id = data.get("media_source_message_id")
-    button = data.get("button")
+    # Черновик собирается один раз: превью и рассылка отправляют одно и то же
+    payload = compile_payload(data.get("text"), data.get("entities"), data.get("media"), data.get("button"))
+    steps = build_send_steps(message.bot, payload)
+    if not steps:
+        await message.answer("❗ Нет сообщения для предпросмотра.")
+        return
 
     await message.answer("📨 Предпросмотр сообщения:")
 
     try:
-        # Если есть и текст, и медиа — показываем отдельно
-        if media_source_chat_id and media_source_message_id:
-            # Копируем медиа
-            await message.bot.copy_message(
-                chat_id=message.chat.id,
-                from_chat_id=media_source_chat_id,
-                message_id=media_source_message_id
-            )
-            # Копируем текст с кнопкой
-            if source_chat_id and source_message_id:
-                await message.bot.copy_message(
-                    chat_id=message.chat.id,
-                    from_chat_id=source_chat_id,
-                    message_id=source_message_id,
-                    reply_markup=button
-                )
-            else:
-                # Если текст отсутствует, кнопка приписывается к медиа
-                if button:
-                    await message.answer(" ", reply_markup=button)
-        else:
-            # Если только текст
-            if source_chat_id and source_message_id:
-                await message.bot.copy_message(
-                    chat_id=message.chat.id,
-                    from_chat_id=source_chat_id,
-                    message_id=source_message_id,
-                    reply_markup=button
-                )
-            else:
-                await message.answer("❗ Нет сообщения для предпросмотра.")
-
+        for step in steps:
+            await step(message.chat.id)
     except Exception as e:
         await message.answer(f"❗ Ошибка при отправке предпросмотра: {e}")
         return
 
+    await state.update_data(payload=payload)
     await message.answer(
-        "Если всё устраивает, отправьте /send для запуска рассылки или /cancel для отмены."
+        "Если всё устраивает, отправьте /send для запуска рассылки или /cancel для отмены.\n\n"
+        f"Чтобы отправить только части подписчиков: /send {Segment.USAGE}\n"
+        "(любые фильтры можно опустить)"
     )
     await state.set_state(BroadcastStates.preview)
 
 
 @router.message(BroadcastStates.preview, Command("send"))
-async def process_send(message: Message, state: FSMContext):
+async def process_send(message: Message, state: FSMContext, command: CommandObject):
     if message.from_user.id not in config.admins:
         return
 
     data = await state.get_data()
 
-    source_chat_id = data.get("source_chat_id")
-    source_message_id = data.get("source_message_id")
-    media_source_chat_id = data.get("media_source_chat_id")
-    media_source_message_id = data.get("media_source_message_id")
-    button = data.get("button")
-
-    users = await get_all_users()
-
-    sent = 0
-    failed = 0
-
-    await message.answer("🚀 Запускаю рассылку...")
-
-    for user_id in users:
-        try:
-            # Если есть медиа — копируем медиа и текст отдельно
-            if media_source_chat_id and media_source_message_id:
-                await message.bot.copy_message(
-                    chat_id=user_id,
-                    from_chat_id=media_source_chat_id,
-                    message_id=media_source_message_id
-                )
-                if source_chat_id and source_message_id:
-                    await message.bot.copy_message(
-                        chat_id=user_id,
-                        from_chat_id=source_chat_id,
-                        message_id=source_message_id,
-                        reply_markup=button
-                    )
-                else:
-                    if button:
-                        await message.bot.send_message(chat_id=user_id, text=" ", reply_markup=button)
-            else:
-                # Если только текст (или пусто)
-                if source_chat_id and source_message_id:
-                    await message.bot.copy_message(
-                        chat_id=user_id,
-                        from_chat_id=source_chat_id,
-                        message_id=source_message_id,
-                        reply_markup=button
-                    )
-                else:
-                    if button:
-                        await message.bot.send_message(chat_id=user_id, text=" ", reply_markup=button)
-
-            sent += 1
-        except Exception:
-            failed += 1
-
-    await message.answer(f"✅ Рассылка завершена. Отправлено: {sent}, Ошибок: {failed}")
+    payload = data.get("payload")
+    if not payload or not build_send_steps(message.bot, payload):
+        await message.answer("❗ Нет сообщения для рассылки.")
+        return
+
+    try:
+        segment = Segment.parse(command.args)
+    except ValueError as e:
+        await message.answer(f"❗ {e}\nИспользуйте: /send {Segment.USAGE}")
+        return
+
     await state.clear()
+    payload = {**payload, "segment": segment.filters()}
+    funnel.hit(BROADCAST, chat_id=segment.chat_id or 0)
+    job_id = await jobs.create(message.bot, message.from_user.id, payload, message.chat.id)
+    await message.answer(
+        f"Рассылка #{job_id} запущена в фоне. Аудитория: {segment.describe()}.\n"
+        f"/bc_status {job_id} — состояние, /bc_pause {job_id} — пауза, /bc_resume {job_id} — продолжить."
+    )
 
 
 @router.message(BroadcastStates.preview, Command("cancel"))
@@ -239,9 +193,61 @@ async def cancel_broadcast(message: Message, state: FSMContext):
     await message.answer("🚫 Рассылка отменена.")
 
 
-async def get_all_users() -> List[int]:
-    users = []
-    rows = await db.get_all_users()  # Метод должен возвращать список строк с user_id
+@router.message(Command("bc_status"))
+async def cmd_broadcast_status(message: Message, command: CommandObject):
+    if message.from_user.id not in config.admins:
+        return
+
+    if command.args and command.args.strip().isdigit():
+        row = await db.get_broadcast_job(int(command.args))
+        rows = [row] if row else []
+    else:
+        rows = await db.get_broadcast_jobs((RUNNING, PAUSED))
+
+    if not rows:
+        await message.answer("Активных рассылок нет.")
+        return
+
+    lines = []
     for row in rows:
-        users.append(row[0])
-    return users
+        job = BroadcastJob.from_row(row)
+        stats = jobs.live_stats(job.id)
+        sent, failed = (stats.sent, stats.failed) if stats else (job.sent, job.failed)
+        lines.append(
+            f"#{job.id} [{job.status}] от {job.created_at}\n"
+            f"Отправлено: {sent}, Ошибок: {failed}, всего: {job.total}"
+            + (f", осталось ~{format_seconds(stats.eta())}" if stats else "")
+        )
+    await message.answer("\n\n".join(lines))
+
+
+@router.message(Command("bc_pause"))
+async def cmd_broadcast_pause(message: Message, command: CommandObject):
+    if message.from_user.id not in config.admins:
+        return
+
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer("Используйте: /bc_pause <id рассылки>")
+        return
+
+    job_id = int(command.args)
+    if await jobs.pause(job_id):
+        await message.answer(f"⏸ Рассылка #{job_id} поставлена на паузу.")
+    else:
+        await message.answer(f"❗ Рассылка #{job_id} сейчас не выполняется.")
+
+
+@router.message(Command("bc_resume"))
+async def cmd_broadcast_resume(message: Message, command: CommandObject):
+    if message.from_user.id not in config.admins:
+        return
+
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer("Используйте: /bc_resume <id рассылки>")
+        return
+
+    job_id = int(command.args)
+    if await jobs.resume(message.bot, job_id):
+        await message.answer(f"▶️ Рассылка #{job_id} продолжена.")
+    else:
+        await message.answer(f"❗ Рассылка #{job_id} не найдена или уже завершена.")
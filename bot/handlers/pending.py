@@ -0,0 +1,205 @@
+import asyncio
+import html
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Router, F, Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+
+from bot.config import config
+from bot.database import db
+from bot.services.broadcaster import RateLimiter
+from bot.services.scheduler import scheduler
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 20
+approve_limiter = RateLimiter(config.approve_rate)
+
+
+def pending_keyboard(chat_id: int, after_id: int, last_id: Optional[int], has_more: bool) -> InlineKeyboardMarkup:
+    # chat_id = 0 — все каналы
+    rows = []
+    if last_id is not None:
+        rows.append([
+            InlineKeyboardButton(text="✅ Одобрить страницу", callback_data=f"pnd:ap:{chat_id}:{after_id}:{last_id}"),
+            InlineKeyboardButton(text="❌ Отклонить страницу", callback_data=f"pnd:rp:{chat_id}:{after_id}:{last_id}"),
+        ])
+        rows.append([
+            InlineKeyboardButton(
+                text="✅ Одобрить все в канале" if chat_id else "✅ Одобрить все",
+                callback_data=f"pnd:aa:{chat_id}:0:0"
+            ),
+            InlineKeyboardButton(
+                text="❌ Отклонить все в канале" if chat_id else "❌ Отклонить все",
+                callback_data=f"pnd:ra:{chat_id}:0:0"
+            ),
+        ])
+    nav = []
+    if after_id:
+        nav.append(InlineKeyboardButton(text="⏮ В начало", callback_data=f"pnd:pg:{chat_id}:0:0"))
+    if has_more and last_id is not None:
+        nav.append(InlineKeyboardButton(text="Далее ➡️", callback_data=f"pnd:pg:{chat_id}:{last_id}:0"))
+    if nav:
+        rows.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+async def render_page(chat_id: int, after_id: int) -> Tuple[str, InlineKeyboardMarkup]:
+    rows = await db.get_pending_page(after_id, PAGE_SIZE + 1, chat_id or None)
+    has_more = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+
+    if not rows:
+        return "Заявок в ожидании нет.", pending_keyboard(chat_id, after_id, None, False)
+
+    lines = [f"⏳ Заявки в ожидании{' по каналу ' + str(chat_id) if chat_id else ''}:\n"]
+    for request_id, user_id, username, full_name, req_chat_id, chat_title, created_at in rows:
+        name = html.escape(full_name or str(user_id))
+        if username:
+            name += f" (@{html.escape(username)})"
+        lines.append(f"#{request_id} {name} → {html.escape(chat_title or str(req_chat_id))} ({req_chat_id})")
+
+    return "\n".join(lines), pending_keyboard(chat_id, after_id, rows[-1][0], has_more)
+
+
+@router.message(Command("pending"))
+async def cmd_pending(message: Message, command: CommandObject):
+    if message.from_user.id not in config.admins:
+        return
+
+    chat_id = 0
+    if command.args:
+        try:
+            chat_id = int(command.args.strip())
+        except ValueError:
+            await message.answer("Используйте: /pending [id канала]")
+            return
+
+    text, keyboard = await render_page(chat_id, 0)
+    await message.answer(text, reply_markup=keyboard)
+
+
+async def resolve_requests(bot: Bot, rows: List[Tuple], approve: bool, admin_id: int) -> Tuple[int, int]:
+    """Одобряет/отклоняет пачку заявок параллельно под общим лимитом и пишет статусы одной транзакцией."""
+
+    async def resolve(row) -> Tuple[int, Optional[str], Tuple[int, int]]:
+        request_id, user_id, chat_id = row[0], row[1], row[4]
+        await approve_limiter.acquire()
+        try:
+            if approve:
+                await bot.approve_chat_join_request(chat_id=chat_id, user_id=user_id)
+            else:
+                await bot.decline_chat_join_request(chat_id=chat_id, user_id=user_id)
+            return request_id, "approved" if approve else "rejected", (user_id, chat_id)
+        except TelegramBadRequest as e:
+            # Заявки уже нет в Telegram (отозвана или обработана вручную)
+            logger.debug(f"Заявка #{request_id} не найдена в Telegram: {e}")
+            return request_id, "expired", (user_id, chat_id)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке заявки #{request_id}: {e}")
+            return request_id, None, (user_id, chat_id)
+
+    results = await asyncio.gather(*(resolve(row) for row in rows))
+    updates = [(request_id, status) for request_id, status, _ in results if status]
+    await db.set_requests_status(updates, admin_id)
+
+    approved = [member for _, status, member in results if status == "approved"]
+    if approved:
+        await db.add_members(approved)
+        # Канал заявки нужен приветствию, чтобы воронка отнесла его и /start к этому каналу
+        by_chat: Dict[int, List[int]] = {}
+        for user_id, chat_id in approved:
+            by_chat.setdefault(chat_id, []).append(user_id)
+        for chat_id, user_ids in by_chat.items():
+            await scheduler.schedule_many("first_welcome", user_ids, delay=1, payload={"chat_id": chat_id})
+
+    done = sum(1 for _, status, _ in results if status in ("approved", "rejected"))
+    return done, len(rows) - done
+
+
+@router.callback_query(F.data.startswith("pnd:"))
+async def process_pending_callback(callback_query: CallbackQuery, bot: Bot):
+    if callback_query.from_user.id not in config.admins:
+        await callback_query.answer("У вас нет прав на выполнение этого действия.")
+        return
+
+    _, action, chat_id, after_id, last_id = callback_query.data.split(":")
+    chat_id, after_id, last_id = int(chat_id), int(after_id), int(last_id)
+
+    if action == "pg":
+        text, keyboard = await render_page(chat_id, after_id)
+        await callback_query.message.edit_text(text, reply_markup=keyboard)
+        await callback_query.answer()
+        return
+
+    approve = action in ("ap", "aa")
+    await callback_query.answer("Обрабатываю заявки...")
+
+    done = failed = 0
+    if action in ("ap", "rp"):
+        # Только заявки с этой страницы: (after_id, last_id]
+        rows = [row for row in await db.get_pending_page(after_id, PAGE_SIZE, chat_id or None) if row[0] <= last_id]
+        done, failed = await resolve_requests(bot, rows, approve, callback_query.from_user.id)
+    else:
+        # Все заявки по keyset-страницам; id растут, так что новые заявки в процессе не зацикливают обход
+        cursor = 0
+        while True:
+            rows = await db.get_pending_page(cursor, PAGE_SIZE * 5, chat_id or None)
+            if not rows:
+                break
+            cursor = rows[-1][0]
+            page_done, page_failed = await resolve_requests(bot, rows, approve, callback_query.from_user.id)
+            done += page_done
+            failed += page_failed
+            try:
+                await callback_query.message.edit_text(
+                    f"⏳ Обработано заявок: {done}, ошибок: {failed}..."
+                )
+            except Exception:
+                pass
+
+    verb = "Одобрено" if approve else "Отклонено"
+    text, keyboard = await render_page(chat_id, 0)
+    await callback_query.message.edit_text(
+        f"{verb}: {done}, не удалось: {failed}\n\n{text}", reply_markup=keyboard
+    )
+
+
+@router.callback_query(F.data.startswith(("approve:", "reject:")))
+async def process_request_callback(callback_query: CallbackQuery, bot: Bot):
+    # Кнопки из уведомления о новой заявке: approve:<id заявки>:<user_id>:<chat_id>
+    if callback_query.from_user.id not in config.admins:
+        await callback_query.answer("У вас нет прав на выполнение этого действия.")
+        return
+
+    action, request_id = callback_query.data.split(":")[:2]
+    row = await db.get_request_by_id(int(request_id))
+    if not row or row[6] != "pending":
+        await callback_query.answer("Эта заявка уже обработана или не существует.")
+        try:
+            await callback_query.message.edit_reply_markup(reply_markup=None)
+        except Exception:
+            pass
+        return
+
+    approve = action == "approve"
+    done, _ = await resolve_requests(bot, [row], approve, callback_query.from_user.id)
+    if not done:
+        await callback_query.answer("Не удалось обработать заявку: возможно, её уже отозвали.", show_alert=True)
+        try:
+            await callback_query.message.edit_reply_markup(reply_markup=None)
+        except Exception:
+            pass
+        return
+
+    await callback_query.answer("Заявка одобрена!" if approve else "Заявка отклонена!")
+    verdict = "✅ Одобрено" if approve else "❌ Отклонено"
+    await callback_query.message.edit_text(
+        text=f"{callback_query.message.html_text}\n\n{verdict} администратором "
+             f"{html.escape(callback_query.from_user.full_name)}",
+        reply_markup=None
+    )
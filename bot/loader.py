@@ -1,8 +1,8 @@
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
-from bot.config import load_config
+from bot.config import config
+from bot.database import db
+from bot.database.fsm_storage import SQLiteStorage
 
-config = load_config()
 bot = Bot(token=config.bot_token, default=DefaultBotProperties(parse_mode='HTML'))
-dp = Dispatcher(storage=MemoryStorage())
+dp = Dispatcher(storage=SQLiteStorage(db, cache_size=config.fsm_cache_size, ttl=config.fsm_cache_ttl))
@@ -0,0 +1,75 @@
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s"
+
+# aiogram пишет строку на каждый апдейт: «Update id=... is handled. Duration ...»
+EVENT_LOGGER = "aiogram.event"
+
+
+class SampleFilter(logging.Filter):
+    """Пропускает каждую N-ю запись ниже WARNING, предупреждения и ошибки — все."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._seen = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if not self.every:
+            return False
+        self._seen += 1
+        return self._seen % self.every == 0
+
+
+class LoopQueueHandler(QueueHandler):
+    """Кладёт запись в очередь как есть: форматирование и запись в поток делает поток слушателя.
+
+    Стандартный QueueHandler форматирует сообщение и трейсбек ещё в вызывающем
+    потоке, то есть в event loop. Проект логирует f-строками, поэтому args
+    почти всегда пусты и откладывать подстановку безопасно.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: str = "INFO", levels: Optional[Dict[str, str]] = None,
+                  event_sample: float = 1.0) -> QueueListener:
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(LoopQueueHandler(records))
+    root.setLevel(level)
+
+    for name, module_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+    if event_sample < 1:
+        logging.getLogger(EVENT_LOGGER).addFilter(SampleFilter(event_sample))
+
+    _listener = QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    # Дописываем всё, что осталось в очереди
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,23 +1,176 @@
 import asyncio
-from bot.loader import bot, dp
+from bot.loader import bot, dp, config
 from bot.handlers import admin, user
 from bot.database.db import db  # импортируем объект базы данных
-from bot.handlers import broadcast
+from bot.handlers import broadcast, pending
+from bot.services.media_cache import media_cache
+from bot.services.scheduler import scheduler
+from bot.services.join_pipeline import join_pipeline
+from bot.services.admin_notifier import admin_notifier
+from bot.services.retention import retention
+from bot.services.funnel import funnel
+from bot.webhook import WebhookServer
+from bot.sharding import ShardRouter, poll_updates
+from bot import metrics
+from bot.logs import setup_logging, stop_logging
+
+metrics_server = None
 
-async def main():
-    # Инициализируем базу данных
-    await db.init_db()
+
+async def on_startup(leader: bool = True, shared: bool = False, worker: int = 0):
+    # shared — базу делят несколько процессов-воркеров; leader — воркер с фоновыми заданиями
+    global metrics_server
+    if config.metrics_port:
+        # Таймеры ставим до init_db, чтобы в метрики попали и первые запросы
+        metrics.instrument_database(db)
+        metrics.instrument_bot(bot)
+        metrics.instrument_dispatcher(dp)
+
+    await db.init_db(
+        write_behind=config.db_write_behind,
+        flush_size=config.db_flush_size,
+        flush_interval=config.db_flush_interval,
+        settings_refresh=config.settings_refresh if shared else 0,
+        # Индекс в памяти верен, только пока в базу пишет один процесс
+        known_index=not shared,
+        # VACUUM при переводе в incremental делает один процесс — тот, что потом и чистит
+        auto_vacuum=leader and config.retention_days > 0
+    )
+
+    # Поднимаем сохранённые file_id медиафайлов
+    await media_cache.load()
 
     # Регистрируем роутеры
     dp.include_routers(
         admin.router,
         user.router,
-        broadcast.router
+        broadcast.router,
+        pending.router
+    )
+
+    if leader:
+        # Продолжаем рассылки, прерванные перезапуском, и поднимаем отложенные сообщения
+        await broadcast.jobs.resume_all(bot)
+        await scheduler.start(
+            bot,
+            workers=config.scheduler_workers,
+            poll_interval=1.0 if shared else None
+        )
+        retention.configure(
+            days=config.retention_days,
+            interval=config.retention_interval,
+            batch_size=config.retention_batch,
+            pause=config.retention_pause,
+            archive_dir=config.archive_dir,
+            vacuum_pages=config.vacuum_pages
+        )
+        await retention.start()
+
+    # WELCOME_RATE — лимит на весь бот: каждый из воркеров получает свою долю, иначе при
+    # WORKERS=N суммарная скорость приветствий вырастет в N раз. APPROVE_RATE не делим:
+    # массовые одобрения из /pending идут от админов, а их апдейты всегда у воркера 0
+    share = config.workers if shared else 1
+
+    # Конвейер заявок на вступление
+    join_pipeline.configure(
+        approve_workers=config.join_approve_workers,
+        welcome_workers=config.join_welcome_workers,
+        queue_size=config.join_queue_size,
+        welcome_rate=config.welcome_rate / share
     )
+    await join_pipeline.start(bot)
+
+    admin_notifier.configure(
+        admins=config.admins,
+        window=config.admin_notify_window,
+        threshold=config.admin_notify_threshold
+    )
+    await admin_notifier.start(bot)
+
+    funnel.configure(flush_interval=config.funnel_flush_interval)
+    await funnel.start()
+
+    if config.metrics_port:
+        metrics.watch_runtime(db, join_pipeline)
+        metrics_server = metrics.MetricsServer(config.metrics_host, config.metrics_port + worker)
+        await metrics_server.start()
 
+
+async def on_shutdown():
+    if metrics_server:
+        await metrics_server.stop()
+    await join_pipeline.stop()
+    await admin_notifier.stop()
+    await funnel.stop()
+    await retention.stop()
+    await scheduler.stop()
+    await broadcast.jobs.shutdown()
+    # Сбрасываем очередь отложенных записей до закрытия соединения
+    await db.flush()
+    await db.close()
+    await bot.session.close()
+
+
+async def run_polling():
     # Удаляем вебхук и запускаем polling
     await bot.delete_webhook(drop_pending_updates=True)
     await dp.start_polling(bot)
 
+
+async def run_webhook(sink):
+    server = WebhookServer(sink, secret=config.webhook_secret, path=config.webhook_path)
+    await server.start(config.webhook_host, config.webhook_port)
+    if config.webhook_base_url:
+        await bot.set_webhook(
+            url=config.webhook_base_url + config.webhook_path,
+            secret_token=config.webhook_secret,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+async def run_sharded():
+    # Фронт только принимает апдейты и раскладывает их по воркерам; диспетчеры живут в воркерах
+    router = ShardRouter(config.workers, config.admins)
+    router.start()
+    # Роутеры во фронте нужны только чтобы узнать, какие типы апдейтов запрашивать
+    dp.include_routers(admin.router, user.router, broadcast.router, pending.router)
+    try:
+        if config.mode == "webhook":
+            await run_webhook(router.dispatch)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            await poll_updates(bot, router.dispatch, dp.resolve_used_update_types())
+    finally:
+        await router.stop()
+        await bot.session.close()
+
+
+async def main():
+    if config.workers > 1:
+        await run_sharded()
+        return
+
+    await on_startup()
+
+    async def feed(update: dict):
+        await dp.feed_raw_update(bot, update)
+
+    try:
+        if config.mode == "webhook":
+            await run_webhook(feed)
+        else:
+            await run_polling()
+    finally:
+        await on_shutdown()
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    setup_logging(config.log_level, config.log_levels, config.log_event_sample)
+    try:
+        asyncio.run(main())
+    finally:
+        stop_logging()
@@ -0,0 +1,295 @@
+import functools
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNotFound,
+    TelegramConflictError, TelegramUnauthorizedError, TelegramServerError, TelegramNetworkError
+)
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, value: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> (счётчики по корзинам, сумма, количество)
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labels: str):
+        record = self._values.get(labels)
+        if record is None:
+            record = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            record[0][index] += 1
+        record[1] += value
+        record[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _labels(self.label_names + ("le",), labels + (str(bound),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    """Значение снимается в момент запроса /metrics."""
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], float]):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, help_text, callback))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_seconds = registry.histogram(
+    "bot_handler_seconds", "Время выполнения хэндлеров", ("event", "handler")
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Исключения в хэндлерах", ("event", "handler")
+)
+api_seconds = registry.histogram(
+    "bot_telegram_api_seconds", "Время запросов к Telegram Bot API", ("method",)
+)
+api_errors = registry.counter(
+    "bot_telegram_api_errors_total", "Ошибки Telegram Bot API по кодам", ("method", "code")
+)
+flood_wait_seconds = registry.counter(
+    "bot_telegram_flood_wait_seconds_total", "Суммарный retry_after из ответов 429", ("method",)
+)
+db_seconds = registry.histogram(
+    "bot_db_seconds", "Время вызовов методов Database", ("method",)
+)
+db_errors = registry.counter(
+    "bot_db_errors_total", "Исключения в методах Database", ("method",)
+)
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    def __init__(self, event_type: str):
+        self.event_type = event_type
+
+    async def __call__(self, handler, event, data: Dict[str, Any]):
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(self.event_type, name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, self.event_type, name)
+
+
+def _error_code(error: Exception) -> str:
+    if isinstance(error, TelegramRetryAfter):
+        return "429"
+    if isinstance(error, TelegramForbiddenError):
+        return "403"
+    if isinstance(error, TelegramNotFound):
+        return "404"
+    if isinstance(error, TelegramConflictError):
+        return "409"
+    if isinstance(error, TelegramUnauthorizedError):
+        return "401"
+    if isinstance(error, TelegramBadRequest):
+        return "400"
+    if isinstance(error, TelegramServerError):
+        return "5xx"
+    if isinstance(error, TelegramNetworkError):
+        return "network"
+    return "error"
+
+
+class ApiTimingMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            api_errors.inc(name, _error_code(e))
+            if isinstance(e, TelegramRetryAfter):
+                flood_wait_seconds.inc(name, value=e.retry_after)
+            raise
+        finally:
+            api_seconds.observe(time.perf_counter() - started, name)
+
+
+def _timed_coroutine(name: str, func: Callable[..., Awaitable]):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            db_errors.inc(name)
+            raise
+        finally:
+            db_seconds.observe(time.perf_counter() - started, name)
+    return wrapper
+
+
+def _timed_generator(name: str, func):
+    # Для async-генераторов считаем только время внутри генератора, без работы потребителя
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        generator = func(*args, **kwargs)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = await generator.__anext__()
+                except StopAsyncIteration:
+                    return
+                except Exception:
+                    db_errors.inc(name)
+                    raise
+                finally:
+                    db_seconds.observe(time.perf_counter() - started, name)
+                yield item
+        finally:
+            # Потребитель вышел раньше (break, ошибка): закрываем и внутренний генератор,
+            # чтобы он сразу освободил курсор или отдельное соединение
+            await generator.aclose()
+    return wrapper
+
+
+def instrument_database(database):
+    """Оборачивает публичные методы Database таймерами (на уровне экземпляра)."""
+    for name in dir(type(database)):
+        if name.startswith("_"):
+            continue
+        func = getattr(database, name)
+        if inspect.isasyncgenfunction(func):
+            setattr(database, name, _timed_generator(name, func))
+        elif inspect.iscoroutinefunction(func):
+            setattr(database, name, _timed_coroutine(name, func))
+
+
+def instrument_dispatcher(dp: Dispatcher):
+    # Inner-middleware на наблюдателях диспетчера действуют и во вложенных роутерах
+    for event_type, observer in dp.observers.items():
+        if event_type in ("update", "error"):
+            continue
+        observer.middleware(HandlerTimingMiddleware(event_type))
+
+
+def instrument_bot(bot):
+    bot.session.middleware(ApiTimingMiddleware())
+
+
+def watch_runtime(database, pipeline):
+    # Глубина очередей и счётчики конвейера снимаются при каждом запросе /metrics
+    registry.gauge(
+        "bot_db_write_queue", "Записи в очереди write-behind",
+        lambda: database._write_queue.qsize() if database._write_queue else 0
+    )
+    for key in pipeline.snapshot():
+        registry.gauge(
+            f"bot_join_pipeline_{key}", f"Конвейер заявок: {key}",
+            lambda key=key: pipeline.snapshot()[key]
+        )
+
+
+class MetricsServer:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
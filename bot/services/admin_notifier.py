@@ -0,0 +1,109 @@
+import asyncio
+import html
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _ChatWindow:
+    title: str
+    # Уведомлений, уже отправленных по отдельности в текущем окне
+    sent: int = 0
+    # Заявок, ушедших в сводку
+    pending: int = 0
+    auto_approved: int = 0
+
+
+class AdminNotifier:
+    """Уведомления администраторов о заявках.
+
+    Всем админам сообщение уходит параллельно. Первые threshold заявок канала
+    за окно window приходят сразу и с кнопками, остальные копятся и в конце
+    окна превращаются в одну сводку по каналу: «N новых заявок, M одобрено».
+    """
+
+    def __init__(self, admins: Optional[List[int]] = None, window: float = 10.0, threshold: int = 3):
+        self.admins = list(admins or [])
+        self.window = window
+        self.threshold = threshold
+        self._windows: Dict[int, _ChatWindow] = {}
+        self._sends: Set[asyncio.Task] = set()
+        self._flusher: Optional[asyncio.Task] = None
+        self._bot: Optional[Bot] = None
+
+    def configure(self, admins: List[int], window: float, threshold: int):
+        self.admins = list(admins)
+        self.window = window
+        self.threshold = threshold
+
+    async def start(self, bot: Bot):
+        self._bot = bot
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        # Недоотправленная сводка не должна потеряться при остановке
+        self._flush()
+        if self._sends:
+            await asyncio.wait(self._sends)
+
+    def notify(self, chat_id: int, chat_title: str, text: str,
+               reply_markup: Optional[InlineKeyboardMarkup] = None, auto_approved: bool = False):
+        # Не ждёт отправки: хэндлер заявки не должен стоять в очереди к Bot API
+        window = self._windows.get(chat_id)
+        if window is None:
+            window = self._windows[chat_id] = _ChatWindow(title=chat_title)
+        if window.sent < self.threshold:
+            window.sent += 1
+            self._fan_out(text, reply_markup)
+        else:
+            window.pending += 1
+            window.auto_approved += auto_approved
+
+    def _fan_out(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        if self._bot is None or not self.admins:
+            return
+        task = asyncio.create_task(self._send_all(text, reply_markup))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _send_all(self, text: str, reply_markup: Optional[InlineKeyboardMarkup]):
+        async def send(admin_id: int):
+            try:
+                await self._bot.send_message(chat_id=admin_id, text=text, reply_markup=reply_markup)
+            except Exception as e:
+                logger.error(f"Не удалось отправить уведомление администратору {admin_id}: {e}")
+
+        await asyncio.gather(*(send(admin_id) for admin_id in self.admins))
+
+    def _flush(self):
+        windows, self._windows = self._windows, {}
+        for chat_id, window in windows.items():
+            if not window.pending:
+                continue
+            text = (
+                f"📥 {html.escape(window.title or str(chat_id))}: ещё новых заявок за {self.window:g}с: "
+                f"{window.pending}"
+            )
+            if window.auto_approved:
+                text += f", из них одобрено автоматически: {window.auto_approved}"
+            if window.pending > window.auto_approved:
+                text += f"\nОжидающие заявки: /pending {chat_id}"
+            self._fan_out(text)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.window)
+            self._flush()
+
+
+admin_notifier = AdminNotifier()
@@ -0,0 +1,390 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, MessageEntity
+
+from bot.database import db
+from bot.services.broadcaster import Broadcaster, BroadcastStats, SendStep, PERMANENT, format_progress
+
+logger = logging.getLogger(__name__)
+
+# Статусы задания рассылки
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+
+
+@dataclass
+class BroadcastJob:
+    id: int
+    created_by: int
+    payload: dict
+    status: str
+    cursor: int
+    total: int
+    sent: int
+    failed: int
+    status_chat_id: Optional[int]
+    status_message_id: Optional[int]
+    created_at: str
+
+    @classmethod
+    def from_row(cls, row: Tuple) -> "BroadcastJob":
+        return cls(
+            id=row[0], created_by=row[1], payload=json.loads(row[2]), status=row[3],
+            cursor=row[4], total=row[5], sent=row[6], failed=row[7],
+            status_chat_id=row[8], status_message_id=row[9], created_at=row[10]
+        )
+
+
+@dataclass
+class Segment:
+    """Аудитория рассылки: канал, диапазон first_seen и активация протокола."""
+
+    chat_id: Optional[int] = None
+    since: Optional[str] = None
+    until: Optional[str] = None
+    activated: Optional[bool] = None
+
+    USAGE = "chat=ID_канала from=ГГГГ-ММ-ДД to=ГГГГ-ММ-ДД activated=yes|no"
+
+    @classmethod
+    def parse(cls, args: Optional[str]) -> "Segment":
+        segment = cls()
+        for token in (args or "").split():
+            key, _, value = token.partition("=")
+            key = key.lower()
+            try:
+                if key == "chat":
+                    segment.chat_id = int(value)
+                elif key in ("from", "to"):
+                    datetime.strptime(value, "%Y-%m-%d")
+                    if key == "from":
+                        segment.since = value
+                    else:
+                        segment.until = value
+                elif key == "activated" and value.lower() in ("yes", "да", "no", "нет"):
+                    segment.activated = value.lower() in ("yes", "да")
+                else:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(f"Неверный фильтр: {token}") from None
+        return segment
+
+    def filters(self) -> dict:
+        # Только заданные фильтры: в таком виде сегмент лежит в payload и уходит в db.iter_users
+        return {key: value for key, value in asdict(self).items() if value is not None}
+
+    def describe(self) -> str:
+        parts = []
+        if self.chat_id is not None:
+            parts.append(f"канал {self.chat_id}")
+        if self.since or self.until:
+            parts.append(f"пришли {self.since or '…'} — {self.until or '…'}")
+        if self.activated is not None:
+            parts.append("активировали протокол" if self.activated else "не активировали протокол")
+        return ", ".join(parts) or "все подписчики"
+
+
+def build_button_markup(button: Optional[dict]) -> Optional[InlineKeyboardMarkup]:
+    if not button:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=button["text"], url=button["url"])]
+    ])
+
+
+# Лимит подписи к медиа в Telegram; длиннее — текст уходит отдельным сообщением
+CAPTION_LIMIT = 1024
+
+
+def compile_payload(text: Optional[str], entities: Optional[List[dict]],
+                    media: Optional[dict], button: Optional[dict]) -> dict:
+    """Собирает черновик рассылки в список сообщений один раз, на этапе превью.
+
+    Фото с текстом уходит одним send_photo с подписью, кнопка цепляется к
+    последнему сообщению. Два вызова остаются только для «кружка» с текстом
+    (у video_note нет подписи) и для текста длиннее CAPTION_LIMIT.
+    """
+    messages: List[dict] = []
+    # Telegram считает длину в UTF-16, как и смещения сущностей
+    if media and media["type"] == "photo" and text and len(text.encode("utf-16-le")) // 2 <= CAPTION_LIMIT:
+        messages.append({"type": "photo", "file_id": media["file_id"],
+                         "caption": text, "caption_entities": entities or None})
+    else:
+        if media:
+            messages.append({"type": media["type"], "file_id": media["file_id"]})
+        if text:
+            messages.append({"type": "text", "text": text, "entities": entities or None})
+    if not messages and button:
+        messages.append({"type": "text", "text": " ", "entities": None})
+    return {"messages": messages, "button": button}
+
+
+def _entities(raw: Optional[List[dict]]) -> Optional[List[MessageEntity]]:
+    return [MessageEntity(**entity) for entity in raw] if raw else None
+
+
+def _message_step(bot: Bot, message: dict, markup: Optional[InlineKeyboardMarkup]) -> SendStep:
+    # Разметка передана сущностями, parse_mode бота по умолчанию (HTML) отключаем
+    if message["type"] == "photo":
+        caption_entities = _entities(message.get("caption_entities"))
+        return lambda user_id: bot.send_photo(
+            chat_id=user_id,
+            photo=message["file_id"],
+            caption=message.get("caption"),
+            caption_entities=caption_entities,
+            parse_mode=None,
+            reply_markup=markup
+        )
+    if message["type"] == "video_note":
+        return lambda user_id: bot.send_video_note(
+            chat_id=user_id,
+            video_note=message["file_id"],
+            reply_markup=markup
+        )
+    entities = _entities(message.get("entities"))
+    return lambda user_id: bot.send_message(
+        chat_id=user_id,
+        text=message["text"],
+        entities=entities,
+        parse_mode=None,
+        reply_markup=markup
+    )
+
+
+def build_send_steps(bot: Bot, payload: dict) -> List[SendStep]:
+    # Каждый шаг — один вызов API, лимитер учитывает их по отдельности
+    button = build_button_markup(payload.get("button"))
+
+    if "messages" in payload:
+        messages = payload["messages"]
+        return [
+            _message_step(bot, message, button if index == len(messages) - 1 else None)
+            for index, message in enumerate(messages)
+        ]
+
+    # Задания, созданные до компиляции черновика: копируем исходные сообщения
+    source_chat_id = payload.get("source_chat_id")
+    source_message_id = payload.get("source_message_id")
+    media_source_chat_id = payload.get("media_source_chat_id")
+    media_source_message_id = payload.get("media_source_message_id")
+
+    steps: List[SendStep] = []
+
+    if media_source_chat_id and media_source_message_id:
+        steps.append(lambda user_id: bot.copy_message(
+            chat_id=user_id,
+            from_chat_id=media_source_chat_id,
+            message_id=media_source_message_id
+        ))
+
+    if source_chat_id and source_message_id:
+        steps.append(lambda user_id: bot.copy_message(
+            chat_id=user_id,
+            from_chat_id=source_chat_id,
+            message_id=source_message_id,
+            reply_markup=button
+        ))
+    elif button:
+        steps.append(lambda user_id: bot.send_message(chat_id=user_id, text=" ", reply_markup=button))
+
+    return steps
+
+
+class _Checkpoint:
+    """Копит результаты доставки и раз в batch_size пишет их в базу вместе с курсором."""
+
+    def __init__(self, job: BroadcastJob, stats: BroadcastStats, batch_size: int):
+        self.job = job
+        self.stats = stats
+        self.batch_size = batch_size
+        self.cursor = job.cursor
+        # user_id в порядке выдачи; курсор двигается, только когда обработан весь префикс
+        self._issued: deque = deque()
+        self._completed: set = set()
+        self._buffer: List[Tuple[int, str]] = []
+        self._unsubscribed: List[int] = []
+        self._lock = asyncio.Lock()
+
+    def issued(self, user_id: int):
+        self._issued.append(user_id)
+
+    async def add(self, user_id: int, outcome: str):
+        # Отложенный (transient) тоже записывается: курсор идёт дальше, а повторный проход
+        # берёт таких из базы. Во время повторного прохода очередь выдачи уже пуста
+        self._buffer.append((user_id, outcome))
+        if outcome in PERMANENT:
+            self._unsubscribed.append(user_id)
+        if self._issued:
+            self._completed.add(user_id)
+            while self._issued and self._issued[0] in self._completed:
+                self.cursor = self._issued.popleft()
+                self._completed.discard(self.cursor)
+        # После неудачной записи буфер не пуст: следующая попытка — ещё через batch_size результатов
+        if len(self._buffer) % self.batch_size == 0:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            deliveries, self._buffer = self._buffer, []
+            unsubscribed, self._unsubscribed = self._unsubscribed, []
+            try:
+                await db.checkpoint_broadcast_job(
+                    self.job.id, self.cursor, self.stats.sent, self.stats.failed, deliveries, unsubscribed
+                )
+            except Exception:
+                # Не теряем результаты: они уйдут со следующим чекпоинтом
+                self._buffer[:0] = deliveries
+                self._unsubscribed[:0] = unsubscribed
+                raise
+
+
+class BroadcastJobManager:
+    def __init__(self, broadcaster: Broadcaster, checkpoint_every: int = 200, page_size: int = 1000):
+        self.broadcaster = broadcaster
+        self.checkpoint_every = checkpoint_every
+        self.page_size = page_size
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._gates: Dict[int, asyncio.Event] = {}
+        self._stats: Dict[int, BroadcastStats] = {}
+
+    async def create(self, bot: Bot, created_by: int, payload: dict, status_chat_id: int) -> int:
+        total = await db.count_users(**payload.get("segment", {}))
+        status_message = await bot.send_message(status_chat_id, "🚀 Запускаю рассылку...")
+        job_id = await db.create_broadcast_job(
+            created_by, json.dumps(payload), total, status_chat_id, status_message.message_id
+        )
+        job = BroadcastJob.from_row(await db.get_broadcast_job(job_id))
+        self._start(bot, job)
+        return job_id
+
+    async def resume_all(self, bot: Bot):
+        # После перезапуска продолжаем незавершённые задания с последнего чекпоинта
+        for row in await db.get_broadcast_jobs((RUNNING,)):
+            job = BroadcastJob.from_row(row)
+            logger.info(f"Возобновляю рассылку #{job.id} с user_id > {job.cursor}")
+            self._start(bot, job)
+
+    async def pause(self, job_id: int) -> bool:
+        gate = self._gates.get(job_id)
+        if gate is None:
+            return False
+        gate.clear()
+        await db.set_broadcast_job_status(job_id, PAUSED)
+        return True
+
+    async def resume(self, bot: Bot, job_id: int) -> bool:
+        row = await db.get_broadcast_job(job_id)
+        if not row or row[3] not in (RUNNING, PAUSED):
+            return False
+        await db.set_broadcast_job_status(job_id, RUNNING)
+        gate = self._gates.get(job_id)
+        if gate is not None:
+            gate.set()
+        else:
+            # Задание было на паузе во время перезапуска — поднимаем его заново
+            self._start(bot, BroadcastJob.from_row(row))
+        return True
+
+    def live_stats(self, job_id: int) -> Optional[BroadcastStats]:
+        return self._stats.get(job_id)
+
+    def _start(self, bot: Bot, job: BroadcastJob):
+        gate = asyncio.Event()
+        gate.set()
+        self._gates[job.id] = gate
+        self._tasks[job.id] = asyncio.create_task(self._run(bot, job, gate))
+
+    async def _run(self, bot: Bot, job: BroadcastJob, gate: asyncio.Event):
+        stats = BroadcastStats(total=job.total, sent=job.sent, failed=job.failed,
+                               resumed_from=job.sent + job.failed)
+        self._stats[job.id] = stats
+        checkpoint = _Checkpoint(job, stats, self.checkpoint_every)
+
+        async def edit_status(title: str):
+            if job.status_chat_id and job.status_message_id:
+                await bot.edit_message_text(
+                    text=format_progress(stats, title=f"{title} #{job.id}"),
+                    chat_id=job.status_chat_id,
+                    message_id=job.status_message_id
+                )
+
+        async def on_progress(_stats: BroadcastStats):
+            await checkpoint.flush()
+            await edit_status("⏸ Рассылка на паузе" if not gate.is_set() else "📤 Рассылка идёт")
+
+        try:
+            delivered = await db.get_broadcast_delivered_after(job.id, job.cursor)
+
+            async def recipients():
+                async for user_id in db.iter_users(after=job.cursor, chunk_size=self.page_size,
+                                                   **job.payload.get("segment", {})):
+                    if user_id in delivered:
+                        continue
+                    checkpoint.issued(user_id)
+                    yield user_id
+
+            async def deferred():
+                # Отложенные могли ещё не дойти до базы
+                await checkpoint.flush()
+                async for user_id in db.iter_broadcast_transient(job.id, chunk_size=self.page_size):
+                    yield user_id
+
+            await self.broadcaster.run(
+                recipients(),
+                build_send_steps(bot, job.payload),
+                on_progress=on_progress,
+                on_result=checkpoint.add,
+                gate=gate,
+                stats=stats,
+                deferred=deferred
+            )
+            await checkpoint.flush()
+            await db.set_broadcast_job_status(job.id, DONE)
+
+            try:
+                await edit_status("✅ Рассылка завершена")
+            except Exception:
+                pass
+            if job.status_chat_id:
+                await bot.send_message(
+                    job.status_chat_id,
+                    f"✅ Рассылка #{job.id} завершена. Отправлено: {stats.sent}, Ошибок: {stats.failed}, "
+                    f"из них сняты с рассылки: {stats.unreachable}"
+                )
+        except asyncio.CancelledError:
+            await checkpoint.flush()
+            raise
+        except Exception as e:
+            logger.error(f"Рассылка #{job.id} остановлена с ошибкой: {e}")
+            try:
+                await checkpoint.flush()
+            except Exception as flush_error:
+                logger.error(f"Не удалось записать чекпоинт рассылки #{job.id}: {flush_error}")
+            if job.status_chat_id:
+                try:
+                    await bot.send_message(
+                        job.status_chat_id,
+                        f"❌ Рассылка #{job.id} остановлена с ошибкой: {e}\n"
+                        f"Отправлено: {stats.sent}, Ошибок: {stats.failed}. Продолжить: /bc_resume {job.id}"
+                    )
+                except Exception as notify_error:
+                    logger.error(f"Не удалось сообщить об остановке рассылки #{job.id}: {notify_error}")
+        finally:
+            self._tasks.pop(job.id, None)
+            self._gates.pop(job.id, None)
+            self._stats.pop(job.id, None)
+
+    async def shutdown(self):
+        # Останавливаем задания, записывая последний чекпоинт; статус остаётся running
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
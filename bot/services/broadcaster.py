@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, List, Optional, Union
+
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramNetworkError, TelegramServerError, TelegramBadRequest,
+    TelegramForbiddenError
+)
+
+logger = logging.getLogger(__name__)
+
+# Итоги доставки одному получателю
+SENT = "sent"
+BLOCKED = "blocked"
+DEACTIVATED = "deactivated"
+NOT_FOUND = "not_found"
+TRANSIENT = "transient"
+FAILED = "failed"
+# После этих итогов писать пользователю бессмысленно — он снимается с рассылок
+PERMANENT = frozenset((BLOCKED, DEACTIVATED, NOT_FOUND))
+
+# Один шаг отправки получателю (например, один copy_message)
+SendStep = Callable[[int], Awaitable]
+ProgressCallback = Callable[["BroadcastStats"], Awaitable]
+ResultCallback = Callable[[int, str], Awaitable]
+# Источник получателей для повторного прохода (те, о ком on_result сообщил TRANSIENT)
+DeferredSource = Callable[[], AsyncIterator[int]]
+
+
+def classify_error(error: Exception) -> str:
+    message = str(error).lower()
+    if isinstance(error, TelegramForbiddenError):
+        return DEACTIVATED if "deactivated" in message else BLOCKED
+    if isinstance(error, TelegramBadRequest):
+        if "chat not found" in message or "user not found" in message:
+            return NOT_FOUND
+        # Ошибка в самом сообщении, а не в получателе
+        return FAILED
+    if isinstance(error, (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)):
+        return TRANSIENT
+    return FAILED
+
+
+class RateLimiter:
+    """Глобальный token bucket: не больше rate вызовов в секунду на весь бот."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        # После flood-wait от Telegram останавливаем всех, а не только упавший вызов
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class BroadcastStats:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    # Из failed: заблокировали бота, удалены или чат не найден
+    unreachable: int = 0
+    # Сколько было обработано до перезапуска — для честного ETA после возобновления
+    resumed_from: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def eta(self) -> Optional[float]:
+        done_now = self.done - self.resumed_from
+        if done_now <= 0 or not self.total:
+            return None
+        return self.elapsed / done_now * max(self.total - self.done, 0)
+
+
+def format_seconds(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}ч {minutes}м"
+    if minutes:
+        return f"{minutes}м {seconds}с"
+    return f"{seconds}с"
+
+
+def format_progress(stats: BroadcastStats, title: str = "📤 Рассылка идёт") -> str:
+    return (
+        f"{title}\n\n"
+        f"Отправлено: {stats.sent}\n"
+        f"Ошибок: {stats.failed} (недоступны: {stats.unreachable})\n"
+        f"Обработано: {stats.done} из {stats.total}\n"
+        f"Осталось: ~{format_seconds(stats.eta())}"
+    )
+
+
+class Broadcaster:
+    def __init__(self, rate: float, concurrency: int, retries: int = 3, progress_interval: float = 3.0,
+                 retry_delay: float = 30.0):
+        self.limiter = RateLimiter(rate)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.progress_interval = progress_interval
+        # Пауза перед повторным проходом по получателям с временными ошибками
+        self.retry_delay = retry_delay
+
+    async def _call(self, step: SendStep, user_id: int):
+        attempt = 0
+        while True:
+            await self.limiter.acquire()
+            try:
+                return await step(user_id)
+            except TelegramRetryAfter as e:
+                # flood-wait не считаем попыткой: ждём сколько сказали и повторяем
+                logger.warning(f"Flood-wait {e.retry_after}с при отправке пользователю {user_id}")
+                self.limiter.pause(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                delay = min(2 ** attempt, 30)
+                logger.warning(f"Временная ошибка для {user_id}: {e}, повтор через {delay}с")
+                await asyncio.sleep(delay)
+
+    async def _deliver(self, steps: List[SendStep], user_id: int) -> str:
+        try:
+            for step in steps:
+                await self._call(step, user_id)
+            return SENT
+        except Exception as e:
+            outcome = classify_error(e)
+            logger.debug(f"Не удалось отправить пользователю {user_id} ({outcome}): {e}")
+            return outcome
+
+    async def run(
+        self,
+        user_ids: Union[Iterable[int], AsyncIterable[int]],
+        steps: List[SendStep],
+        total: int = 0,
+        on_progress: Optional[ProgressCallback] = None,
+        on_result: Optional[ResultCallback] = None,
+        gate: Optional[asyncio.Event] = None,
+        stats: Optional[BroadcastStats] = None,
+        deferred: Optional[DeferredSource] = None,
+    ) -> BroadcastStats:
+        stats = stats or BroadcastStats(total=total)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        # Получатели с временной ошибкой не копятся в памяти: on_result получает TRANSIENT,
+        # вызывающий их запоминает, а после основного прохода отдаёт через deferred
+        final_pass = deferred is None
+
+        async def worker():
+            while True:
+                user_id = await queue.get()
+                try:
+                    # gate снят — рассылка на паузе, ждём возобновления
+                    if gate is not None:
+                        await gate.wait()
+                    outcome = await self._deliver(steps, user_id)
+                    if outcome == TRANSIENT and final_pass:
+                        # Второй попытки не будет
+                        outcome = FAILED
+                    if outcome == SENT:
+                        stats.sent += 1
+                    elif outcome != TRANSIENT:
+                        stats.failed += 1
+                        if outcome in PERMANENT:
+                            stats.unreachable += 1
+                    if on_result:
+                        try:
+                            await on_result(user_id, outcome)
+                        except Exception as e:
+                            # Воркер не должен умереть: без воркеров queue.join() ждал бы вечно
+                            logger.error(f"Не удалось сохранить результат доставки пользователю {user_id}: {e}")
+                finally:
+                    queue.task_done()
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(self.progress_interval)
+                try:
+                    await on_progress(stats)
+                except Exception as e:
+                    logger.debug(f"Не удалось обновить прогресс рассылки: {e}")
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        progress_task = asyncio.create_task(reporter()) if on_progress else None
+        try:
+            if hasattr(user_ids, "__aiter__"):
+                async for user_id in user_ids:
+                    await queue.put(user_id)
+            else:
+                for user_id in user_ids:
+                    await queue.put(user_id)
+            await queue.join()
+
+            if not final_pass:
+                final_pass = True
+                async with aclosing(deferred()) as retries:
+                    first = await anext(retries, None)
+                    if first is not None:
+                        logger.info(f"Повторная отправка получателям с временными ошибками через {self.retry_delay}с")
+                        await asyncio.sleep(self.retry_delay)
+                        await queue.put(first)
+                        async for user_id in retries:
+                            await queue.put(user_id)
+                        await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            if progress_task:
+                progress_task.cancel()
+            await asyncio.gather(*workers, *([progress_task] if progress_task else []), return_exceptions=True)
+
+        return stats
@@ -0,0 +1,98 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+BASE_MEDIA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "media"))
+
+# Ник для ЛС без @ и текст, который подставится в строку ввода
+DM_USERNAME = "ray_trdr"
+DM_PREFILL_TEXT = "Активировать протокол"
+
+FIRST_WELCOME_PHOTO = "welcome.jpg"
+FIRST_WELCOME_CAPTION = (
+    "👋🏻<b>Привет! Спасибо за подписку на мой канал!</b>\n\n"
+    "У меня нет никаких:\n"
+    "<blockquote>❌<b>VIP каналов.\n"
+    "❌Платных курсов.\n"
+    "❌Доверительного управления.</b></blockquote>\n\n"
+    "Моя цель набрать <b>100k подписчиков!</b>\n"
+    "Я торгую по собственной стратегии с <b>Winrate 90%!</b> тем самым приумножаю свой капитал и помогаю в этом своим подписчикам!\n\n"
+    "⚠️<b>Как именно я помогаю:</b>\n"
+    "<blockquote>🔸<b>Бесплатно провожу торговые сессии, чтоб вы могли зарабатывать вместе со мной</b>\n"
+    "🔸<b>Даю полезный материал для трейдеров и различные торговые стратегии</b></blockquote>\n\n"
+    "Нажми кнопку ниже и узнаешь какие результаты ты сможешь делать с <b>первого дня</b>👇🏻"
+)
+
+PROTOCOL_PHOTOS = ("welcome2.jpg", "welcome3.jpg", "welcome4.jpg", "welcome5.jpg", "welcome6.jpg")
+PROTOCOL_TEXT = (
+    "🤝🏻<b>Благодаря моему каналу ты сможешь подружиться с ВАЛЮТНЫМ РЫНКОМ💹</b>\n\n"
+    "<blockquote><b>Мы торгуем с понедельника по пятницу и я регулярно выкладываю отчёты!</b></blockquote>\n\n"
+    "Мой <b>бесплатный</b> канал с сигналами и обучающим материалами называется:\n"
+    "<tg-spoiler><b>The R.A.Y. Protocol</b></tg-spoiler>\n\n"
+    "<i>Напиши мне</i>\n"
+    "<b>« Активировать протокол »</b>, и я дам пошаговую инструкцию!😉\n\n"
+    "❕ВАЖНЫЙ МОМЕНТ❕\n\n"
+    "У меня есть <b>БОНУС</b>, который поможет быстро стартануть и увидеть <b>результаты!</b>💰💰💰"
+)
+PROTOCOL_REMINDER_TEXT = (
+    "⚡️<b>Важно</b>⚡️\n\n"
+    "🔕<b>Не отключай уведомления этого бота.</b>\n"
+    "Он будет присылать только полезную информацию.\n\n"
+    "Уже скоро что-то отправлю!"
+)
+
+
+@dataclass(frozen=True)
+class WelcomeContent:
+    first_photo: str
+    first_caption: str
+    first_keyboard: InlineKeyboardMarkup
+    protocol_photos: Tuple[str, ...]
+    protocol_text: str
+    protocol_keyboard: InlineKeyboardMarkup
+    reminder_text: str
+
+
+class ContentStore:
+    """Предсобранный контент приветствий.
+
+    Статичные тексты и клавиатуры собираются один раз, при первом приветствии.
+    """
+
+    def __init__(self):
+        self._welcome: Optional[WelcomeContent] = None
+        self._welcome_lock = asyncio.Lock()
+
+    async def welcome(self, bot) -> WelcomeContent:
+        if self._welcome is None:
+            # Первые апдейты после старта приходят пачкой: get_me должен уйти один раз
+            async with self._welcome_lock:
+                if self._welcome is None:
+                    self._welcome = await self._build_welcome(bot)
+        return self._welcome
+
+    async def _build_welcome(self, bot) -> WelcomeContent:
+        bot_username = (await bot.get_me()).username
+        start_link = f"https://t.me/{bot_username}?start=activate_protocol"
+        deep_link_url = f"https://t.me/{DM_USERNAME}?text={quote(DM_PREFILL_TEXT)}"
+
+        return WelcomeContent(
+            first_photo=os.path.join(BASE_MEDIA_PATH, FIRST_WELCOME_PHOTO),
+            first_caption=FIRST_WELCOME_CAPTION,
+            first_keyboard=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="Узнать результаты💸", url=start_link)]
+            ]),
+            protocol_photos=tuple(os.path.join(BASE_MEDIA_PATH, name) for name in PROTOCOL_PHOTOS),
+            protocol_text=PROTOCOL_TEXT,
+            protocol_keyboard=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="Активировать протокол💬", url=deep_link_url)]
+            ]),
+            reminder_text=PROTOCOL_REMINDER_TEXT,
+        )
+
+
+content_store = ContentStore()
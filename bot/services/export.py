@@ -0,0 +1,49 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from contextlib import aclosing
+from typing import List, Tuple
+
+from bot.database import db
+
+# Имя в команде -> таблица
+EXPORT_TABLES = {"users": "users", "requests": "join_requests"}
+EXPORT_FORMATS = ("csv", "jsonl")
+
+
+def _encode(columns: Tuple[str, ...], rows: List[Tuple], fmt: str) -> str:
+    if fmt == "jsonl":
+        return "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+async def export_table(name: str, fmt: str) -> Tuple[str, int]:
+    """Выгружает таблицу в gzip-файл во временном каталоге, возвращает (путь, число строк).
+
+    Пачки строк из db.export_rows кодируются и сжимаются в потоке, event loop
+    занят только чтением следующей пачки. Файл удаляет вызывающий.
+    """
+    table = EXPORT_TABLES[name]
+    columns = db.EXPORT_COLUMNS[table]
+    fd, path = tempfile.mkstemp(prefix=f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-", suffix=f".{fmt}.gz")
+    count = 0
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8", newline="") as out:
+            if fmt == "csv":
+                await asyncio.to_thread(out.write, _encode(columns, [columns], fmt))
+            # aclosing: при ошибке записи генератор сразу закрывает своё read-only соединение
+            async with aclosing(db.export_rows(table)) as chunks:
+                async for rows in chunks:
+                    await asyncio.to_thread(lambda: out.write(_encode(columns, rows, fmt)))
+                    count += len(rows)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from bot.database import db
+
+logger = logging.getLogger(__name__)
+
+# Этапы воронки: заявка -> приветствие -> /start activate_protocol; рассылки считаются отдельно
+REQUEST = "request"
+WELCOME = "welcome"
+START = "start"
+BROADCAST = "broadcast"
+STAGES = (REQUEST, WELCOME, START, BROADCAST)
+
+
+def hour_bucket(ts: Optional[float] = None) -> str:
+    # Час в UTC в формате CURRENT_TIMESTAMP: строки сравниваются как даты
+    return time.strftime("%Y-%m-%d %H:00:00", time.gmtime(ts))
+
+
+class Funnel:
+    """Счётчики воронки по (час, канал, этап).
+
+    hit() только увеличивает счётчик в памяти; раз в flush_interval накопленное
+    прибавляется к funnel_stats одним upsert. /stats читает уже агрегированные строки.
+    """
+
+    def __init__(self, flush_interval: float = 30.0, remember: int = 100000):
+        self.flush_interval = flush_interval
+        self._counts: Counter = Counter()
+        # Канал, после заявки в который пользователю ушло приветствие: к нему относим его /start
+        self._user_chats: Dict[int, int] = {}
+        self._remember = remember
+        self.chat_titles: Dict[int, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def configure(self, flush_interval: float):
+        self.flush_interval = flush_interval
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def hit(self, stage: str, chat_id: Optional[int] = None, user_id: Optional[int] = None,
+            chat_title: Optional[str] = None):
+        if chat_id is None:
+            chat_id = self._user_chats.get(user_id, 0)
+        elif user_id is not None and chat_id:
+            self._user_chats.pop(user_id, None)
+            self._user_chats[user_id] = chat_id
+            if len(self._user_chats) > self._remember:
+                # dict помнит порядок вставки: вытесняем самого давнего
+                del self._user_chats[next(iter(self._user_chats))]
+        if chat_title:
+            self.chat_titles[chat_id] = chat_title
+        self._counts[(hour_bucket(), chat_id, stage)] += 1
+
+    async def flush(self):
+        counts, self._counts = self._counts, Counter()
+        if not counts:
+            return
+        try:
+            await db.add_funnel_counts([(*key, count) for key, count in counts.items()])
+        except Exception as e:
+            # Не теряем счётчики: вернём их к следующему сбросу
+            self._counts.update(counts)
+            logger.error(f"Не удалось сохранить счётчики воронки: {e}")
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+funnel = Funnel()
@@ -0,0 +1,219 @@
+import asyncio
+import html
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import ChatJoinRequest, InlineKeyboardMarkup, InlineKeyboardButton
+
+from bot.database import db
+from bot.services.admin_notifier import admin_notifier
+from bot.services.broadcaster import RateLimiter
+from bot.services.scheduler import scheduler
+from bot.services.welcome import send_first_welcome
+
+logger = logging.getLogger(__name__)
+
+
+def admin_request_text(user_id: int, username: Optional[str], full_name: Optional[str],
+                       chat_title: str, request_id: Optional[int] = None) -> str:
+    text = (
+        f"Новая заявка на вступление в канал {html.escape(chat_title)}\n"
+        f"от пользователя {html.escape(full_name or str(user_id))}"
+    )
+    if username:
+        text += f" (@{html.escape(username)})"
+    text += f"\nID пользователя: {user_id}"
+    if request_id is not None:
+        text += f"\nID заявки: {request_id}"
+    return text
+
+
+@dataclass
+class PipelineStats:
+    received: int = 0
+    approved: int = 0
+    approve_failed: int = 0
+    # Сколько раз Telegram ответил на одобрение flood-wait (429)
+    approve_flood_waits: int = 0
+    welcomed: int = 0
+    welcome_failed: int = 0
+    # Приветствия, не влезшие в очередь и отданные планировщику
+    welcome_deferred: int = 0
+    # Сколько раз хэндлер ждал свободного места в очереди одобрения
+    backpressure_waits: int = 0
+    # Максимальное время ожидания в очереди за последний интервал (секунды)
+    approve_lag: float = 0.0
+    welcome_lag: float = 0.0
+
+
+class JoinPipeline:
+    """Обработка всплесков заявок на вступление.
+
+    Хэндлер только кладёт заявку в ограниченную очередь. Быстрая полоса
+    одобряет заявку и пишет её в базу, медленная — отправляет приветствие
+    под своим лимитом скорости, так что одобрения не ждут отправку фото.
+    """
+
+    def __init__(self, approve_workers: int = 8, welcome_workers: int = 4,
+                 queue_size: int = 10000, welcome_rate: float = 20.0):
+        self.approve_workers = approve_workers
+        self.welcome_workers = welcome_workers
+        self.queue_size = queue_size
+        self.welcome_rate = welcome_rate
+        self.stats = PipelineStats()
+        self._approve_queue: Optional[asyncio.Queue] = None
+        self._welcome_queue: Optional[asyncio.Queue] = None
+        self._welcome_limiter: Optional[RateLimiter] = None
+        self._tasks: List[asyncio.Task] = []
+        self._bot: Optional[Bot] = None
+
+    def configure(self, approve_workers: int, welcome_workers: int, queue_size: int, welcome_rate: float):
+        self.approve_workers = approve_workers
+        self.welcome_workers = welcome_workers
+        self.queue_size = queue_size
+        self.welcome_rate = welcome_rate
+
+    async def start(self, bot: Bot):
+        self._bot = bot
+        self._approve_queue = asyncio.Queue(maxsize=self.queue_size)
+        self._welcome_queue = asyncio.Queue(maxsize=self.queue_size)
+        self._welcome_limiter = RateLimiter(self.welcome_rate)
+        self._tasks = [asyncio.create_task(self._approve_worker()) for _ in range(self.approve_workers)]
+        self._tasks += [asyncio.create_task(self._welcome_worker()) for _ in range(self.welcome_workers)]
+
+    async def stop(self, drain_timeout: float = 5.0):
+        # Даём быстрой полосе дообработать то, что уже принято
+        if self._approve_queue is not None:
+            try:
+                await asyncio.wait_for(self._approve_queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Не успели обработать {self._approve_queue.qsize()} заявок до остановки")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._defer_welcomes()
+
+    async def _defer_welcomes(self):
+        # Заявки уже одобрены: неотправленные приветствия отдаём планировщику, он переживёт перезапуск
+        if self._welcome_queue is None:
+            return
+        by_chat: Dict[int, List[int]] = {}
+        while not self._welcome_queue.empty():
+            _, user_id, chat_id = self._welcome_queue.get_nowait()
+            self._welcome_queue.task_done()
+            by_chat.setdefault(chat_id, []).append(user_id)
+        for chat_id, user_ids in by_chat.items():
+            await scheduler.schedule_many("first_welcome", user_ids, payload={"chat_id": chat_id})
+            self.stats.welcome_deferred += len(user_ids)
+        if by_chat:
+            logger.info(f"Приветствий передано планировщику при остановке: {sum(map(len, by_chat.values()))}")
+
+    async def submit(self, event: ChatJoinRequest):
+        self.stats.received += 1
+        item = (time.monotonic(), event.from_user.id, event.from_user.username,
+                event.from_user.full_name, event.chat.id, event.chat.title or "")
+        try:
+            self._approve_queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Очередь заполнена — хэндлер ждёт, пока освободится место
+            self.stats.backpressure_waits += 1
+            await self._approve_queue.put(item)
+
+    def snapshot(self) -> dict:
+        stats = self.stats
+        return {
+            "approve_queue": self._approve_queue.qsize() if self._approve_queue else 0,
+            "welcome_queue": self._welcome_queue.qsize() if self._welcome_queue else 0,
+            "queue_size": self.queue_size,
+            **stats.__dict__,
+        }
+
+    def reset_lag(self):
+        self.stats.approve_lag = 0.0
+        self.stats.welcome_lag = 0.0
+
+    async def _approve_worker(self):
+        while True:
+            enqueued_at, user_id, username, full_name, chat_id, chat_title = await self._approve_queue.get()
+            try:
+                self.stats.approve_lag = max(self.stats.approve_lag, time.monotonic() - enqueued_at)
+                await self._approve(user_id, username, full_name, chat_id, chat_title)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке заявки от пользователя {user_id}: {e}")
+            finally:
+                self._approve_queue.task_done()
+
+    async def _approve(self, user_id: int, username: Optional[str], full_name: Optional[str],
+                       chat_id: int, chat_title: str):
+        if await db.get_setting("auto_approve") != "true":
+            # Автоодобрение выключено — заявка ждёт решения администратора; id нужен для кнопок
+            request_id = await db.add_request(user_id, username, full_name, chat_id, chat_title)
+            markup = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="Одобрить заявку", callback_data=f"approve:{request_id}:{user_id}:{chat_id}")],
+                [InlineKeyboardButton(text="Отклонить", callback_data=f"reject:{request_id}:{user_id}:{chat_id}")],
+            ])
+            admin_notifier.notify(
+                chat_id, chat_title, admin_request_text(user_id, username, full_name, chat_title, request_id), markup
+            )
+            return
+
+        while True:
+            try:
+                await self._bot.approve_chat_join_request(chat_id=chat_id, user_id=user_id)
+                break
+            except TelegramRetryAfter as e:
+                # flood-wait не роняет заявку: ждём сколько сказал Telegram и повторяем
+                self.stats.approve_flood_waits += 1
+                logger.warning(f"Flood-wait {e.retry_after}с при одобрении заявки {user_id} в {chat_id}")
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                self.stats.approve_failed += 1
+                logger.warning(f"Telegram не дал одобрить заявку {user_id} в {chat_id}: {e}")
+                return
+        self.stats.approved += 1
+
+        await db.record_request(user_id, username, full_name, chat_id, chat_title,
+                                status='approved', approved_by=-1)
+        await db.add_members([(user_id, chat_id)])
+        admin_notifier.notify(
+            chat_id, chat_title,
+            admin_request_text(user_id, username, full_name, chat_title) + "\n\nЗаявка была автоматически одобрена",
+            auto_approved=True
+        )
+
+        item = (time.monotonic(), user_id, chat_id)
+        try:
+            self._welcome_queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Медленная полоса не справляется — отдаём приветствие планировщику, но одобрения не тормозим
+            self.stats.welcome_deferred += 1
+            await scheduler.schedule("first_welcome", user_id, payload={"chat_id": chat_id})
+
+    async def _welcome_worker(self):
+        while True:
+            item = await self._welcome_queue.get()
+            enqueued_at, user_id, chat_id = item
+            try:
+                self.stats.welcome_lag = max(self.stats.welcome_lag, time.monotonic() - enqueued_at)
+                try:
+                    await self._welcome_limiter.acquire()
+                except asyncio.CancelledError:
+                    # Остановка, пока ждали лимит: приветствие ещё не ушло — вернём его в очередь для stop()
+                    self._welcome_queue.put_nowait(item)
+                    raise
+                # Отправляем первое приветствие — фото + кнопка запуска /start activate_protocol
+                await send_first_welcome(user_id, self._bot, chat_id)
+                self.stats.welcomed += 1
+            except Exception as e:
+                self.stats.welcome_failed += 1
+                logger.error(f"Не удалось отправить приветственное сообщение пользователю {user_id}: {e}")
+            finally:
+                self._welcome_queue.task_done()
+
+
+join_pipeline = JoinPipeline()
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, List, Optional, Tuple, Union
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputMediaPhoto, Message
+
+from bot.database import db
+
+logger = logging.getLogger(__name__)
+
+
+# Ошибки, означающие, что Telegram не знает сохранённый file_id. Остальные BadRequest
+# («chat not found» и т. п.) к файлу отношения не имеют, и кэш из-за них не сбрасываем
+STALE_FILE_ERRORS = ("wrong file identifier", "wrong remote file")
+
+
+def is_stale_file_error(e: TelegramBadRequest) -> bool:
+    message = e.message.lower()
+    return any(marker in message for marker in STALE_FILE_ERRORS)
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaCache:
+    """Кэш Telegram file_id для локальных файлов.
+
+    Ключ — sha256 содержимого, поэтому изменённый на диске файл автоматически
+    загружается заново. Хэш пересчитывается только при смене mtime/размера.
+    """
+
+    def __init__(self):
+        self._hashes: Dict[str, Tuple[float, int, str]] = {}  # path -> (mtime, size, sha256)
+        self._file_ids: Dict[str, str] = {}  # sha256 -> file_id
+        # sha256 -> future с file_id для файлов, которые сейчас загружаются
+        self._uploads: Dict[str, asyncio.Future] = {}
+
+    async def load(self):
+        self._file_ids = await db.get_media_file_ids()
+
+    async def content_hash(self, path: str) -> str:
+        stat = os.stat(path)  # FileNotFoundError, если файла нет
+        cached = self._hashes.get(path)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+        content_hash = await asyncio.to_thread(_file_hash, path)
+        self._hashes[path] = (stat.st_mtime, stat.st_size, content_hash)
+        return content_hash
+
+    async def get(self, path: str) -> Tuple[Union[str, FSInputFile], str]:
+        content_hash = await self.content_hash(path)
+        file_id = await self._file_id(content_hash)
+        return (file_id or FSInputFile(path)), content_hash
+
+    async def _file_id(self, content_hash: str) -> Optional[str]:
+        file_id = self._file_ids.get(content_hash)
+        while file_id is None and content_hash in self._uploads:
+            # Файл уже загружает другой отправитель — ждём его file_id, а не грузим ещё раз.
+            # None — его загрузка не удалась: пробует следующий, остальные ждут дальше
+            file_id = await asyncio.shield(self._uploads[content_hash])
+        return file_id
+
+    async def _claim(self, paths: List[str]) -> Tuple[List[Tuple[Union[str, FSInputFile], str]], Dict[str, asyncio.Future]]:
+        # Файлы без file_id помечаются как загружаемые нами; между get и пометкой были await,
+        # и если за это время файл начал грузить или уже загрузил кто-то другой — собираем заново
+        while True:
+            items = [await self.get(path) for path in paths]
+            if not any(isinstance(photo, FSInputFile)
+                       and (content_hash in self._uploads or content_hash in self._file_ids)
+                       for photo, content_hash in items):
+                break
+        loop = asyncio.get_running_loop()
+        claimed = {}
+        for photo, content_hash in items:
+            if isinstance(photo, FSInputFile):
+                claimed[content_hash] = self._uploads[content_hash] = loop.create_future()
+        return items, claimed
+
+    def _release(self, claimed: Dict[str, asyncio.Future]):
+        for content_hash, future in claimed.items():
+            if self._uploads.get(content_hash) is future:
+                del self._uploads[content_hash]
+            if not future.done():
+                future.set_result(self._file_ids.get(content_hash))
+
+    async def remember(self, content_hash: str, path: str, file_id: str):
+        if self._file_ids.get(content_hash) == file_id:
+            return
+        self._file_ids[content_hash] = file_id
+        await db.set_media_file_id(content_hash, path, file_id)
+
+    async def forget(self, content_hash: str):
+        if self._file_ids.pop(content_hash, None) is not None:
+            await db.delete_media_file_id(content_hash)
+
+    async def send_photo(self, bot, chat_id: int, path: str, **kwargs) -> Message:
+        [(photo, content_hash)], claimed = await self._claim([path])
+        if not isinstance(photo, FSInputFile):
+            try:
+                return await bot.send_photo(chat_id=chat_id, photo=photo, **kwargs)
+            except TelegramBadRequest as e:
+                if not is_stale_file_error(e):
+                    raise
+                # file_id протух (например, сменился токен бота) — загружаем файл заново
+                logger.warning(f"file_id для {path} не принят Telegram ({e}), загружаю файл заново")
+                await self.forget(content_hash)
+                [(photo, content_hash)], claimed = await self._claim([path])
+                if not isinstance(photo, FSInputFile):
+                    return await bot.send_photo(chat_id=chat_id, photo=photo, **kwargs)
+
+        try:
+            message = await bot.send_photo(chat_id=chat_id, photo=photo, **kwargs)
+            await self.remember(content_hash, path, message.photo[-1].file_id)
+        finally:
+            self._release(claimed)
+        return message
+
+    async def send_media_group(self, bot, chat_id: int, paths: List[str]) -> List[Message]:
+        items, claimed = await self._claim(paths)
+        if not claimed:
+            try:
+                return await bot.send_media_group(
+                    chat_id=chat_id, media=[InputMediaPhoto(media=photo) for photo, _ in items]
+                )
+            except TelegramBadRequest as e:
+                if not is_stale_file_error(e):
+                    raise
+                logger.warning(f"file_id медиагруппы не принят Telegram ({e}), загружаю файлы заново")
+                for _, content_hash in items:
+                    await self.forget(content_hash)
+                items, claimed = await self._claim(paths)
+
+        try:
+            messages = await bot.send_media_group(
+                chat_id=chat_id, media=[InputMediaPhoto(media=photo) for photo, _ in items]
+            )
+            for path, (photo, content_hash), message in zip(paths, items, messages):
+                if isinstance(photo, FSInputFile) and message.photo:
+                    await self.remember(content_hash, path, message.photo[-1].file_id)
+        finally:
+            self._release(claimed)
+        return messages
+
+
+media_cache = MediaCache()
@@ -0,0 +1,93 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from bot.database import db
+
+logger = logging.getLogger(__name__)
+
+
+class RequestRetention:
+    """Фоновая чистка join_requests.
+
+    Решённые заявки старше days дней дописываются в архив archive_dir/join_requests-ГГГГ-ММ.jsonl.gz
+    (по месяцу created_at), затем удаляются из базы небольшими пачками с паузой, чтобы
+    очередь записи не вставала. Освободившиеся страницы возвращаются файлу через incremental_vacuum.
+    """
+
+    def __init__(self, days: int = 0, interval: float = 6 * 3600, batch_size: int = 500,
+                 pause: float = 0.2, archive_dir: str = "archive", vacuum_pages: int = 1000):
+        self.days = days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.archive_dir = archive_dir
+        self.vacuum_pages = vacuum_pages
+        self._task: Optional[asyncio.Task] = None
+
+    def configure(self, days: int, interval: float, batch_size: int, pause: float,
+                  archive_dir: str, vacuum_pages: int):
+        self.days = days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.archive_dir = archive_dir
+        self.vacuum_pages = vacuum_pages
+
+    async def start(self):
+        if self.days > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка при архивации заявок: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> int:
+        archived, after_id = 0, 0
+        while True:
+            rows = await db.get_resolved_requests(f"-{self.days} days", after_id, self.batch_size)
+            if not rows:
+                break
+            # Сначала архив, потом удаление: при сбое между ними строка попадёт в архив дважды, но не потеряется
+            await asyncio.to_thread(self._append_archive, rows)
+            await db.delete_requests([row[0] for row in rows])
+            archived += len(rows)
+            after_id = rows[-1][0]
+            if len(rows) < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+
+        freed = await db.incremental_vacuum(self.vacuum_pages)
+        if archived or freed:
+            logger.info(f"Архивировано заявок: {archived}, освобождено страниц базы: {freed}")
+        return archived
+
+    def _append_archive(self, rows: List[Tuple]):
+        by_month: Dict[str, List[str]] = defaultdict(list)
+        for row in rows:
+            record = dict(zip(db.REQUEST_COLUMNS, row))
+            by_month[str(record["created_at"])[:7]].append(json.dumps(record, ensure_ascii=False))
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for month, lines in by_month.items():
+            path = os.path.join(self.archive_dir, f"join_requests-{month}.jsonl.gz")
+            # Каждая пачка — отдельный gzip-member: zcat и gzip.open читают такой файл целиком
+            with gzip.open(path, "at", encoding="utf-8") as archive:
+                archive.write("\n".join(lines) + "\n")
+
+
+retention = RequestRetention()
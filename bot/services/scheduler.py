@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+
+from bot.database import db
+from bot.services.broadcaster import classify_error, PERMANENT
+
+logger = logging.getLogger(__name__)
+
+# Обработчик отложенного сообщения: (bot, chat_id, payload)
+JobHandler = Callable[[Bot, int, dict], Awaitable]
+
+
+class Scheduler:
+    """Отложенные отправки через таблицу scheduled_messages.
+
+    Хэндлеры только ставят задачу и сразу возвращаются. Один таймер достаёт
+    из базы то, что пора отправить, и раздаёт воркерам; несделанное
+    переживает перезапуск.
+    """
+
+    def __init__(self, workers: int = 4, batch_size: int = 100, max_attempts: int = 5):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._handlers: Dict[str, JobHandler] = {}
+        self._wakeup = asyncio.Event()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._bot: Optional[Bot] = None
+        self.poll_interval: Optional[float] = None
+
+    def handler(self, kind: str):
+        def decorator(func: JobHandler) -> JobHandler:
+            self._handlers[kind] = func
+            return func
+        return decorator
+
+    async def schedule(self, kind: str, chat_id: int, delay: float = 0, payload: Optional[dict] = None) -> int:
+        if kind not in self._handlers:
+            raise ValueError(f"Неизвестный тип отложенного сообщения: {kind}")
+        job_id = await db.add_scheduled(time.time() + delay, kind, chat_id, json.dumps(payload or {}))
+        self._wakeup.set()
+        return job_id
+
+    async def schedule_many(self, kind: str, chat_ids: List[int], delay: float = 0, payload: Optional[dict] = None):
+        if kind not in self._handlers:
+            raise ValueError(f"Неизвестный тип отложенного сообщения: {kind}")
+        await db.add_scheduled_many(time.time() + delay, kind, chat_ids, json.dumps(payload or {}))
+        self._wakeup.set()
+
+    async def start(self, bot: Bot, workers: Optional[int] = None, poll_interval: Optional[float] = None):
+        self._bot = bot
+        self.workers = workers or self.workers
+        # Если задачи ставят и другие процессы, будим таймер не реже poll_interval
+        self.poll_interval = poll_interval
+        self._queue = asyncio.Queue(maxsize=self.workers * 4)
+        # То, что было взято в работу до перезапуска, отправляем заново
+        await db.reset_claimed_scheduled()
+        self._tasks = [asyncio.create_task(self._timer())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _timer(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                rows = await db.claim_due_scheduled(time.time(), self.batch_size)
+            except Exception as e:
+                logger.error(f"Не удалось получить отложенные сообщения: {e}")
+                await asyncio.sleep(5)
+                continue
+
+            for row in rows:
+                await self._queue.put(row)
+            if len(rows) == self.batch_size:
+                continue
+
+            next_due = await db.next_scheduled_due()
+            timeout = None if next_due is None else max(0.0, next_due - time.time())
+            if self.poll_interval is not None:
+                timeout = self.poll_interval if timeout is None else min(timeout, self.poll_interval)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            job_id, kind, chat_id, payload, attempts = await self._queue.get()
+            try:
+                await self._handlers[kind](self._bot, chat_id, json.loads(payload))
+                await db.delete_scheduled(job_id)
+            except Exception as e:
+                if classify_error(e) in PERMANENT:
+                    # Пользователь заблокировал бота или удалён — повторять бесполезно
+                    logger.info(f"Отложенное сообщение {kind} для {chat_id} отменено: {e}")
+                    await db.delete_scheduled(job_id)
+                    await db.mark_unsubscribed([chat_id])
+                    continue
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    logger.error(f"Отложенное сообщение {kind} для {chat_id} не отправлено: {e}")
+                    await db.fail_scheduled(job_id)
+                else:
+                    delay = min(2 ** attempts * 5, 600)
+                    logger.warning(f"Ошибка отложенного сообщения {kind} для {chat_id}: {e}, повтор через {delay}с")
+                    await db.retry_scheduled(job_id, time.time() + delay, attempts)
+                    self._wakeup.set()
+            finally:
+                self._queue.task_done()
+
+
+scheduler = Scheduler()
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import multiprocessing as mp
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Поля апдейта, в которых есть отправитель (from)
+USER_FIELDS = (
+    "message", "edited_message", "callback_query", "chat_join_request",
+    "my_chat_member", "chat_member", "inline_query", "chosen_inline_result",
+    "shipping_query", "pre_checkout_query", "poll_answer", "message_reaction",
+    "business_message", "edited_business_message",
+)
+
+
+def update_user_id(update: Dict[str, Any]) -> int:
+    for field in USER_FIELDS:
+        event = update.get(field)
+        if not event:
+            continue
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+        chat = event.get("chat")
+        if chat:
+            return chat["id"]
+    return update.get("update_id", 0)
+
+
+class ShardRouter:
+    """Раскладывает апдейты по процессам-воркерам по user_id.
+
+    Все апдейты одного пользователя попадают в один воркер и обрабатываются
+    там по порядку. Апдейты админов всегда идут в воркер 0 (лидер): там
+    крутятся рассылки и планировщик, которыми админы управляют.
+    """
+
+    def __init__(self, workers: int, admins: List[int]):
+        self.workers = workers
+        self.admins = set(admins)
+        ctx = mp.get_context("spawn")
+        self.queues = [ctx.Queue() for _ in range(workers)]
+        self.processes = [
+            ctx.Process(target=worker_process, args=(index, self.queues[index]), name=f"bot-worker-{index}")
+            for index in range(workers)
+        ]
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def shard(self, user_id: int) -> int:
+        if user_id in self.admins:
+            return 0
+        return user_id % self.workers
+
+    async def dispatch(self, update: Dict[str, Any]):
+        # В очередь кладём строку: воркер разберёт её сам, фронт не тратит время на pickle dict
+        self.queues[self.shard(update_user_id(update))].put(json.dumps(update))
+
+    async def stop(self, timeout: float = 30.0):
+        for queue in self.queues:
+            queue.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logger.warning(f"{process.name} не остановился за {timeout}с, завершаю")
+                process.terminate()
+
+
+async def poll_updates(bot, sink, allowed_updates: List[str], timeout: int = 30):
+    """Long polling без разбора апдейтов в aiogram: сырые dict сразу уходят в шардер."""
+    url = bot.session.api.api_url(bot.token, "getUpdates")
+    offset: Optional[int] = None
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout + 10)) as session:
+        while True:
+            params = {"timeout": timeout, "allowed_updates": json.dumps(allowed_updates)}
+            if offset is not None:
+                params["offset"] = offset
+            try:
+                async with session.get(url, params=params) as response:
+                    result = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Ошибка getUpdates: {e}, повтор через 1с")
+                await asyncio.sleep(1)
+                continue
+
+            if not result.get("ok"):
+                retry_after = (result.get("parameters") or {}).get("retry_after", 1)
+                logger.warning(f"getUpdates: {result.get('description')}, повтор через {retry_after}с")
+                await asyncio.sleep(retry_after)
+                continue
+
+            for update in result["result"]:
+                offset = update["update_id"] + 1
+                await sink(update)
+
+
+def worker_process(index: int, queue):
+    # spawn-процесс начинает с чистого logging: поднимаем свою очередь логов
+    from bot.config import config
+    from bot.logs import setup_logging, stop_logging
+
+    setup_logging(config.log_level, config.log_levels, config.log_event_sample)
+    try:
+        asyncio.run(run_worker(index, queue))
+    finally:
+        stop_logging()
+
+
+async def run_worker(index: int, queue):
+    from bot.main import on_startup, on_shutdown
+    from bot.loader import bot, dp, config
+
+    leader = index == 0
+    await on_startup(leader=leader, shared=True, worker=index)
+
+    # Полосы внутри воркера: апдейты одного пользователя идут по одной полосе строго по порядку
+    lanes = [asyncio.Queue() for _ in range(config.worker_lanes)]
+
+    async def lane_worker(lane: asyncio.Queue):
+        while True:
+            update = await lane.get()
+            try:
+                await dp.feed_raw_update(bot, update)
+            except Exception as e:
+                logger.error(f"Воркер {index}: ошибка обработки апдейта {update.get('update_id')}: {e}")
+            finally:
+                lane.task_done()
+
+    lane_tasks = [asyncio.create_task(lane_worker(lane)) for lane in lanes]
+    loop = asyncio.get_running_loop()
+    logger.info(f"Воркер {index} запущен{' (лидер)' if leader else ''}")
+
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, queue.get)
+            if raw is None:
+                break
+            update = json.loads(raw)
+            lanes[update_user_id(update) % len(lanes)].put_nowait(update)
+
+        for lane in lanes:
+            await lane.join()
+    finally:
+        for task in lane_tasks:
+            task.cancel()
+        await asyncio.gather(*lane_tasks, return_exceptions=True)
+        await on_shutdown()
@@ -0,0 +1,239 @@
+"""Нагрузочный прогон бота против подменного Bot API.
+
+    python -m bot.tools.bench join --count 2000 --latency 0.05 --flood-rate 0.01
+    python -m bot.tools.bench broadcast --count 5000
+    python -m bot.tools.bench start --count 500
+
+Сценарии гоняют настоящие хэндлеры через dp.feed_raw_update: join —
+handle_join_request и конвейер заявок, broadcast — process_send и фоновую
+рассылку, start — handle_start_activate_protocol. База создаётся во
+временной папке. Лимиты скорости берутся из обычных переменных окружения
+(BROADCAST_RATE, WELCOME_RATE, ...), так что прогон меряет боевые настройки.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.client.telegram import TelegramAPIServer
+
+from bot.tools.fake_api import FakeTelegramAPI
+
+ADMIN_ID = 1000
+CHANNEL_ID = -1001000000000
+FIRST_USER_ID = 10_000_000
+
+
+class ApiLatency(BaseRequestMiddleware):
+    """Замеряет каждый вызов Bot API со стороны бота, включая ретраи aiogram."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+
+    async def __call__(self, make_request, bot, method):
+        started = time.monotonic()
+        try:
+            return await make_request(bot, method)
+        finally:
+            self.latencies[method.__api_method__].append(time.monotonic() - started)
+
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return "нет данных"
+    values = sorted(values)
+    return (f"p50={values[len(values) // 2] * 1000:.1f}мс, "
+            f"p99={values[min(int(len(values) * 0.99), len(values) - 1)] * 1000:.1f}мс")
+
+
+def join_update(update_id: int, user_id: int) -> dict:
+    return {"update_id": update_id, "chat_join_request": {
+        "chat": {"id": CHANNEL_ID, "type": "channel", "title": "Bench"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"},
+        "user_chat_id": user_id,
+        "date": int(time.time()),
+    }}
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"},
+        "text": text,
+    }}
+
+
+async def wait_until(predicate, timeout: float, interval: float = 0.05) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await predicate():
+            return True
+        await asyncio.sleep(interval)
+    return False
+
+
+async def bench_join(api: FakeTelegramAPI, count: int, timeout: float):
+    from bot.loader import bot, dp
+    from bot.database import db
+    from bot.services.join_pipeline import join_pipeline
+
+    await db.set_setting("auto_approve", "true")
+    user_ids = range(FIRST_USER_ID, FIRST_USER_ID + count)
+    fed_at: Dict[int, float] = {}
+
+    async def feed(index: int, user_id: int):
+        fed_at[user_id] = time.monotonic()
+        await dp.feed_raw_update(bot, join_update(index, user_id))
+
+    started = time.monotonic()
+    # Как вебхук: все апдейты приходят разом, каждый в своей задаче
+    await asyncio.gather(*(feed(index, user_id) for index, user_id in enumerate(user_ids)))
+    accepted = time.monotonic() - started
+
+    async def finished() -> bool:
+        stats = join_pipeline.stats
+        return stats.welcomed + stats.welcome_failed + stats.welcome_deferred + stats.approve_failed >= count
+
+    completed = await wait_until(finished, timeout)
+    elapsed = time.monotonic() - started
+
+    approve_lag, welcome_lag = [], []
+    for method, chat_id, at in api.calls:
+        if chat_id in fed_at:
+            if method == "approveChatJoinRequest":
+                approve_lag.append(at - fed_at[chat_id])
+            elif method == "sendPhoto":
+                welcome_lag.append(at - fed_at[chat_id])
+
+    print(f"Заявок: {count}, приняты хэндлером за {accepted:.2f}с ({count / accepted:.0f}/с)")
+    print(f"Обработаны за {elapsed:.2f}с ({count / elapsed:.0f}/с){'' if completed else ' — ТАЙМАУТ'}")
+    print(f"Статистика конвейера: {join_pipeline.snapshot()}")
+    print(f"Заявка → одобрение: {percentiles(approve_lag)}")
+    print(f"Заявка → приветствие: {percentiles(welcome_lag)}")
+
+
+async def bench_broadcast(api: FakeTelegramAPI, count: int, timeout: float):
+    from aiogram.fsm.storage.base import StorageKey
+    from bot.loader import bot, dp
+    from bot.database import db
+    from bot.handlers.broadcast import BroadcastStates
+    from bot.services.broadcast_jobs import DONE, compile_payload
+
+    await db.add_users(list(range(FIRST_USER_ID, FIRST_USER_ID + count)))
+    await db.flush()
+
+    # Мастер /broadcast уже пройден: в FSM лежит готовое превью
+    key = StorageKey(bot_id=bot.id, chat_id=ADMIN_ID, user_id=ADMIN_ID)
+    await dp.storage.set_state(key, BroadcastStates.preview)
+    await dp.storage.set_data(key, {"payload": compile_payload(
+        "Бенчмарк рассылки",
+        [{"type": "bold", "offset": 0, "length": 9}],
+        {"type": "photo", "file_id": "bench-photo"},
+        {"text": "Открыть", "url": "https://t.me/bench_bot"},
+    )})
+
+    started = time.monotonic()
+    await dp.feed_raw_update(bot, message_update(1, ADMIN_ID, "/send"))
+    job_id = max(row[0] for row in await db.get_broadcast_jobs((DONE, "running", "paused")))
+
+    async def finished() -> bool:
+        row = await db.get_broadcast_job(job_id)
+        return row is not None and row[3] == DONE
+
+    completed = await wait_until(finished, timeout, interval=0.2)
+    elapsed = time.monotonic() - started
+    row = await db.get_broadcast_job(job_id)
+
+    print(f"Получателей: {count}, рассылка #{job_id} за {elapsed:.2f}с "
+          f"({count / elapsed:.0f} сообщений/с){'' if completed else ' — ТАЙМАУТ'}")
+    print(f"Отправлено: {row[6]}, ошибок: {row[7]}")
+
+
+async def bench_start(api: FakeTelegramAPI, count: int, timeout: float):
+    from bot.loader import bot, dp
+
+    handler_latency = []
+
+    async def feed(index: int, user_id: int):
+        started = time.monotonic()
+        await dp.feed_raw_update(bot, message_update(index, user_id, "/start activate_protocol"))
+        handler_latency.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(
+        feed(index, user_id) for index, user_id in enumerate(range(FIRST_USER_ID, FIRST_USER_ID + count))
+    ))
+    elapsed = time.monotonic() - started
+
+    print(f"/start activate_protocol: {count} за {elapsed:.2f}с ({count / elapsed:.0f}/с)")
+    print(f"Хэндлер: {percentiles(handler_latency)}")
+
+
+SCENARIOS = {
+    "join": bench_join,
+    "broadcast": bench_broadcast,
+    "start": bench_start,
+}
+
+
+async def run(args):
+    api = FakeTelegramAPI(args.latency, args.jitter, args.flood_rate, args.retry_after, seed=args.seed)
+    await api.start("127.0.0.1", args.port)
+
+    # Бот и база импортируются после подготовки окружения: config читается при импорте
+    from bot.loader import bot
+    from bot.logs import setup_logging, stop_logging
+    from bot.main import on_startup, on_shutdown
+
+    bot.session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{args.port}")
+    latency = ApiLatency()
+    bot.session.middleware(latency)
+    setup_logging(args.log_level)
+
+    await on_startup()
+    try:
+        await SCENARIOS[args.scenario](api, args.count, args.timeout)
+    finally:
+        await on_shutdown()
+        await api.stop()
+        stop_logging()
+
+    print(f"Вызовы Bot API: {dict(api.counts)}")
+    if api.floods:
+        print(f"Ответы 429: {dict(api.floods)}")
+    for method, values in sorted(latency.latencies.items()):
+        print(f"  {method}: {len(values)} шт., {percentiles(values)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота против подменного Bot API")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа Bot API, с")
+    parser.add_argument("--jitter", type=float, default=0.02, help="случайная добавка к задержке, с")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=600.0, help="сколько ждать завершения, с")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    os.environ["BOT_TOKEN"] = "123456:bench"
+    os.environ["ADMINS"] = str(ADMIN_ID)
+    os.environ["BOT_MODE"] = "polling"
+    os.environ["WORKERS"] = "1"
+    # База прогона живёт во временной папке и не трогает рабочую
+    os.chdir(tempfile.mkdtemp(prefix="bot-bench-"))
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Локальная подмена Telegram Bot API для нагрузочных прогонов.
+
+    python -m bot.tools.fake_api --port 8081 --latency 0.05 --flood-rate 0.01
+
+Отвечает правдоподобными объектами на методы, которыми пользуется бот,
+держит задержку ответа и с заданной вероятностью отдаёт 429 с retry_after.
+Бот направляется сюда через TelegramAPIServer.from_base("http://127.0.0.1:8081").
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeTelegramAPI:
+    """aiohttp-приложение, изображающее Bot API.
+
+    Все вызовы записываются в calls как (метод, chat_id, время ответа по
+    time.monotonic()), чтобы прогон мог посчитать сквозные задержки.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0,
+                 flood_rate: float = 0.0, retry_after: int = 1, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls: List[Tuple[str, Optional[int], float]] = []
+        self.counts: Counter = Counter()
+        self.floods: Counter = Counter()
+        self._ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await request.post()
+        # Для заявок на вступление интересен пользователь, а не канал
+        chat_id = params.get("user_id") or params.get("chat_id")
+        chat_id = int(chat_id) if chat_id and str(chat_id).lstrip("-").isdigit() else None
+
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        self.counts[method] += 1
+        if self.flood_rate and self.random.random() < self.flood_rate:
+            self.floods[method] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        self.calls.append((method, chat_id, time.monotonic()))
+        return web.json_response({"ok": True, "result": self.result(method, chat_id, params)})
+
+    def message(self, chat_id: Optional[int], **fields) -> Dict[str, Any]:
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id or 0, "type": "private"},
+            "from": BOT_USER,
+            **fields,
+        }
+
+    def photo(self) -> List[Dict[str, Any]]:
+        file_id = f"fake-photo-{next(self._ids)}"
+        return [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 720}]
+
+    def result(self, method: str, chat_id: Optional[int], params) -> Any:
+        if method == "getMe":
+            return BOT_USER
+        if method == "sendMessage":
+            return self.message(chat_id, text=params.get("text", ""))
+        if method == "sendPhoto":
+            return self.message(chat_id, photo=self.photo(), caption=params.get("caption"))
+        if method == "sendMediaGroup":
+            # Число элементов альбома не разбираем: боту важны только file_id в ответе
+            return [self.message(chat_id, photo=self.photo(), media_group_id="1") for _ in range(5)]
+        if method == "sendDocument":
+            file_id = f"fake-document-{next(self._ids)}"
+            return self.message(chat_id, document={"file_id": file_id, "file_unique_id": file_id},
+                                caption=params.get("caption"))
+        if method == "copyMessage":
+            return {"message_id": next(self._ids)}
+        if method == "editMessageText":
+            return self.message(chat_id, text=params.get("text", ""))
+        # approveChatJoinRequest, declineChatJoinRequest, answerCallbackQuery, setWebhook, ...
+        return True
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081):
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подменный Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, с")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    async def serve():
+        api = FakeTelegramAPI(args.latency, args.jitter, args.flood_rate, args.retry_after)
+        await api.start(args.host, args.port)
+        print(f"Подменный Bot API: http://{args.host}:{args.port}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await api.stop()
+            print(f"Вызовы: {dict(api.counts)}, 429: {dict(api.floods)}")
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Прогон записанных апдейтов через локальный вебхук.
+
+    python -m bot.tools.replay_updates updates.jsonl --url http://127.0.0.1:8080/webhook
+
+Файл — по одному JSON-апдейту Telegram на строку. Секрет берётся из WEBHOOK_SECRET.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+
+from bot.webhook import SECRET_HEADER
+
+
+async def replay(path: str, url: str, secret: str, concurrency: int):
+    with open(path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+    latencies = []
+
+    async with aiohttp.ClientSession(headers={SECRET_HEADER: secret}) as session:
+        async def post(update):
+            async with semaphore:
+                started = time.monotonic()
+                async with session.post(url, json=update) as response:
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+                latencies.append(time.monotonic() - started)
+
+        started = time.monotonic()
+        await asyncio.gather(*(post(update) for update in updates))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    print(f"Отправлено апдейтов: {len(updates)} за {elapsed:.2f}с ({len(updates) / elapsed:.0f}/с)")
+    print(f"Ответы: {statuses}")
+    if latencies:
+        print(f"Подтверждение: p50={latencies[len(latencies) // 2] * 1000:.1f}мс, "
+              f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.1f}мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Прогон записанных апдейтов через вебхук")
+    parser.add_argument("file")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(replay(args.file, args.url, args.secret, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import asyncio
+import hmac
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Set
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Куда отдаётся принятый апдейт: в диспетчер этого процесса или дальше
+UpdateSink = Callable[[Dict[str, Any]], Awaitable]
+
+
+class WebhookServer:
+    """aiohttp-сервер для вебхука Telegram.
+
+    Проверяет секретный токен, сразу отвечает 200 и обрабатывает апдейт в
+    фоновой задаче, чтобы Telegram не ждал хэндлеры.
+    """
+
+    def __init__(self, sink: UpdateSink, secret: str, path: str = "/webhook"):
+        self.sink = sink
+        self.secret = secret
+        self.path = path
+        self._tasks: Set[asyncio.Task] = set()
+        self._runner: web.AppRunner = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        # compare_digest на str принимает только ASCII: чужой заголовок с другими символами дал бы 500
+        token = request.headers.get(SECRET_HEADER, "").encode("utf-8", "replace")
+        if not self.secret or not hmac.compare_digest(token, self.secret.encode()):
+            return web.Response(status=401)
+
+        try:
+            update = json.loads(await request.read())
+        except ValueError:
+            return web.Response(status=400)
+
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Dict[str, Any]):
+        try:
+            await self.sink(update)
+        except Exception as e:
+            logger.error(f"Ошибка обработки апдейта {update.get('update_id')}: {e}")
+
+    async def start(self, host: str, port: int):
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Вебхук слушает http://{host}:{port}{self.path}")
+
+    async def stop(self, timeout: float = 10.0):
+        if self._runner:
+            await self._runner.cleanup()
+        # Дожидаемся апдейтов, которые уже приняты и подтверждены Telegram
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)